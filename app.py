@@ -1,65 +1,56 @@
 from __future__ import annotations
-import os, pathlib, shutil, zipfile, io, re
-from typing import Dict, Any, List, Optional
-from flask import Flask, render_template, request, send_file
-from recipegen.parsers import parse_recipe_pdf
-from recipegen.nfp_parser import extract_panel_text, parse_nfp_text_to_per100g
-from recipegen.units import normalize_volume_to_grams
-from recipegen.nutrition import override_per100, choose_mix_id
-from recipegen.images import compress_to_webp
-from recipegen.render import render_html, make_json_ld
-import recipegen.usda as usda
-from werkzeug.utils import secure_filename
-
-ROUND = 1
-
-CLEAN_RX = re.compile(r'\b(chopped|minced|diced|sliced|fresh|raw|peeled|ground)\b', re.I)
-
-def _clean_name(s: str) -> str:
-    s = re.sub(r'\(.*?\)', '', s)
-    s = s.split(',')[0]
-    s = CLEAN_RX.sub('', s)
-    s = re.sub(r'\s+', ' ', s)
-    return s.strip()
+import time
+_IMPORT_T0 = time.perf_counter()
+import json, os, pathlib, shutil, tempfile
+from typing import Dict, Any, List
+from flask import Flask, Request, render_template, request, send_file
+from recipegen.build import build_recipes, write_archive, problem, BuildStopped
+from recipegen.resolve import load_manifest
+from recipegen.ingest import IngestStream, UploadBudget, save_upload, IMAGE_KINDS, MAX_REQUEST_BYTES
+from werkzeug.exceptions import HTTPException
+
+class IngestRequest(Request):
+    """Streams every multipart file part through an IngestStream (hash, sniff, limits)."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        budget = self.__dict__.setdefault('_upload_budget', UploadBudget())
+        SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+        return IngestStream(budget, filename=filename, spool_dir=SPOOL_DIR)
+
 app = Flask(__name__, template_folder='templates', static_folder='static')
+app.request_class = IngestRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
 BASE = pathlib.Path(__file__).resolve().parent
-
-def _slugish(s: str) -> str:
-    s = s.lower()
-    s = re.sub(r'[^a-z0-9]+', '-', s)
-    return re.sub(r'-+', '-', s).strip('-')
-
-def find_image_for(stem: str, images_dir: pathlib.Path):
-    """Return the first image whose stem matches the PDF's stem (case-insensitive, punctuation-insensitive)."""
-    want = _slugish(stem)
-    for p in images_dir.iterdir():
-        if not p.is_file(): 
-            continue
-        if p.suffix.lower() not in ('.webp','.jpg','.jpeg','.png'):
-            continue
-        if _slugish(p.stem) == want:
-            return p
-    return None
-
-def multiply_per100(per100: Dict[str, float], grams: float) -> Dict[str, float]:
-    f = grams / 100.0
-    return {k: (round(v * f, ROUND) if v is not None else None) for k,v in per100.items()}
-
-def sum_macros(items: List[Dict[str, float]]) -> Dict[str, float]:
-    keys = ('calories','fat_g','carbs_g','fiber_g','protein_g')
-    out = {k: 0.0 for k in keys}
-    for it in items:
-        for k in keys:
-            v = it.get(k)
-            if v is not None:
-                out[k] += v
-    return {k: round(v, ROUND) for k,v in out.items()}
-
-def compute_net(per_serving: Dict[str, float]) -> Optional[float]:
-    c = per_serving.get('carbs_g')
-    f = per_serving.get('fiber_g')
-    if c is None or f is None: return None
-    return round(c - f, ROUND)
+# Large parts spool here, next to the per-request work dirs, so saving them is a rename.
+SPOOL_DIR = BASE / 'uploads'
+
+# Heavy libraries (pdfplumber, PIL, pytesseract, rapidfuzz, requests, yaml, pint)
+# are imported inside the recipegen functions that use them, so importing this
+# module stays within IMPORT_BUDGET_MS and '/' can answer right after boot.
+IMPORT_BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', '800'))
+
+def warm() -> float:
+    """
+    Import heavy dependencies and build shared tables once; returns the time taken in ms.
+
+    Called from gunicorn's when_ready hook with preload_app, i.e. in the master
+    before workers fork, so every worker shares the result copy-on-write.
+    """
+    t0 = time.perf_counter()
+    import pdfplumber, pytesseract, rapidfuzz, requests, yaml  # noqa: F401
+    from PIL import Image, ImageOps  # noqa: F401
+    from recipegen import nutrition, units
+    Image.init()  # register every image plugin (WebP encoder included) up front
+    nutrition.merged_overrides()
+    nutrition.load_mix_map()
+    units._merged_densities()
+    units._unit_factors()
+    app.jinja_env.get_template('index.html')
+    return (time.perf_counter() - t0) * 1000
+
+def _error_page(problems: List[Dict[str, Any]]):
+    msg = problems[0]['message'] if len(problems) == 1 else f"{len(problems)} problem(s) found; no pages were built."
+    return render_template('index.html', message=msg, success=False, download_url=None, problems=problems if len(problems) > 1 else None)
 
 @app.route('/', methods=['GET'])
 def index():
@@ -67,36 +58,51 @@ def index():
 
 @app.route('/generate', methods=['POST'])
 def generate():
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    work = pathlib.Path(tempfile.mkdtemp(prefix='req-', dir=SPOOL_DIR))  # one per request: threads share a pid
     try:
-        work = BASE / 'uploads' / secure_filename(str(os.getpid()))
-        if work.exists(): shutil.rmtree(work)
         (work / 'mix_panels').mkdir(parents=True, exist_ok=True)
         (work / 'images').mkdir(parents=True, exist_ok=True)
         (work / 'pdfs').mkdir(parents=True, exist_ok=True)
         (work / 'out').mkdir(parents=True, exist_ok=True)
+        mode = request.form.get('mode', 'stop')
 
         template_file = request.files['template']
-        tpl_path = work / secure_filename(template_file.filename)
-        template_file.save(tpl_path)
-
-        for f in request.files.getlist('recipes'):
-            if f.filename.lower().endswith('.pdf'):
-                f.save(work / 'pdfs' / secure_filename(f.filename))
-
-        for f in request.files.getlist('images'):
-            if any(f.filename.lower().endswith(e) for e in ('.jpg','.jpeg','.png','.webp')):
-                f.save(work / 'images' / secure_filename(f.filename))
-
-        for f in request.files.getlist('mix_panels'):
-            if any(f.filename.lower().endswith(e) for e in ('.pdf','.png','.jpg','.jpeg','.webp')):
-                f.save(work / 'mix_panels' / secure_filename(f.filename))
+        tpl = save_upload(template_file, work, ('text',))
+        if not tpl:
+            return render_template('index.html', message="Template must be a text/HTML file.", success=False, download_url=None)
+        tpl_path = tpl['path']
+
+        uploads: Dict[pathlib.Path, Dict[str, Any]] = {}
+        rejected: List[Dict[str, Any]] = []
+        for field, sub, kinds in (('recipes', 'pdfs', ('pdf',)),
+                                  ('images', 'images', IMAGE_KINDS),
+                                  ('mix_panels', 'mix_panels', ('pdf',) + IMAGE_KINDS)):
+            for f in request.files.getlist(field):
+                entry = save_upload(f, work / sub, kinds)
+                if entry:
+                    uploads[entry['path']] = entry
+                elif f.filename:
+                    found = getattr(f.stream, 'kind', None) or 'unrecognised data'
+                    rejected.append(problem(None, 'unsupported_upload',
+                                            f"{f.filename} was skipped: expected {'/'.join(kinds)}, found {found}.",
+                                            file=f.filename))
+        if rejected and mode == 'stop':
+            return _error_page(rejected)
 
         data_dir = BASE / 'data'
         data_dir.mkdir(exist_ok=True)
         for key in ['ingredient_overrides','density_overrides','mix_map']:
             file = request.files.get(key)
             if file and file.filename:
-                file.save(data_dir / secure_filename(file.filename))
+                save_upload(file, data_dir, ('text',))
+
+        pinned = None
+        resolution_file = request.files.get('resolution')
+        if resolution_file and resolution_file.filename:
+            pinned_entry = save_upload(resolution_file, work, ('text',))
+            if pinned_entry:
+                pinned = load_manifest(pinned_entry['path'])
 
         usda_key = request.form.get('usda_key') or ''
         if usda_key:
@@ -107,90 +113,38 @@ def generate():
         emit_jsonld = 'emit_jsonld' in request.form
 
         pdfs = sorted((work / 'pdfs').glob('*.pdf'))
-        panels_dir = work / 'mix_panels'
-
-        for pdf in pdfs:
-            stem = pdf.stem
-            img = find_image_for(stem, work / 'images')
-            if not img:
-                return render_template('index.html', message=f"No image found for {stem}.", success=False, download_url=None)
-
-            parsed = parse_recipe_pdf(pdf)
-            servings = parsed['servings']
-
-            nutrient_items = []
-            normalized_ings = []
-            for ing in parsed['ingredients']:
-                qname = _clean_name(ing['name'])
-                per100 = override_per100(qname)
-                if not per100:
-                    mix_id = choose_mix_id(qname)
-                    if mix_id:
-                        cand = None
-                        for ext in ('.pdf','.png','.jpg','.jpeg','.webp'):
-                            q = panels_dir / f"{mix_id}{ext}"
-                            if q.exists(): cand = q; break
-                        if cand:
-                            text = extract_panel_text(cand)
-                            parsed_panel = parse_nfp_text_to_per100g(text)
-                            per100 = parsed_panel['per_100g']
-                if not per100:
-                    per100 = usda.search_per100g(qname, api_key=usda_key or None)
-
-                if not per100:
-                    return render_template('index.html', message=f"Missing nutrition data for '{ing['name']}'. Add override/mix or provide USDA key.", success=False, download_url=None)
-
-                g = 0.0
-                if ing.get('amount') and ing.get('unit'):
-                    g = normalize_volume_to_grams(qname, ing['amount'], ing['unit']) or 0.0
-                    if g == 0.0 and ing.get('unit') not in ('','g','kg'):
-                        return render_template('index.html', message=f"Need density for {ing['name']} to convert {ing['amount']} {ing['unit']} to grams.", success=False, download_url=None)
-
-                amt_macros = multiply_per100(per100, g) if g else {k: 0.0 for k in ('calories','fat_g','carbs_g','fiber_g','protein_g')}
-                nutrient_items.append(amt_macros)
-
-                disp = f"{ing['name']} — {int(round(g))} g" if units=='metric' and g>0 else                        (f"{ing['name']} — {ing['amount']:g} {ing['unit']}" if ing.get('amount') and ing.get('unit') else ing['name'])
-                normalized_ings.append({**ing, 'amount_g': g, 'display': disp})
-
-            totals = sum_macros(nutrient_items)
-            per_serving = {k: round(v/servings, ROUND) for k,v in totals.items()}
-            per_serving['net_carbs_g'] = compute_net(per_serving)
-
-            out_dir = work / 'out' / 'recipes' / stem
-            out_dir.mkdir(parents=True, exist_ok=True)
-            compress_to_webp(img, out_dir / 'image.webp')
-
-            context = {
-                'title': stem.replace('-', ' ').title(),
-                'description': '',
-                'canonical_url': None if not site_base_url else f"{site_base_url.rstrip('/')}/recipes/{stem}/",
-                'image': 'image.webp',
-                'servings': servings,
-                'ingredients': normalized_ings,
-                'instructions': parsed['instructions'],
-                'nutrition_per_serving': per_serving,
-                'emit_jsonld': emit_jsonld,
-                'json_ld': make_json_ld({
-                    'title': stem.replace('-', ' ').title(),
-                    'image': 'image.webp',
-                    'servings': servings,
-                    'nutrition_per_serving': per_serving
-                }) if emit_jsonld else ""
-            }
-
-            html = render_html(tpl_path, context)
-            (out_dir / 'index.html').write_text(html, encoding='utf-8')
-
-        out_zip = io.BytesIO()
-        with zipfile.ZipFile(out_zip, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for path in (work / 'out').rglob('*'):
-                if path.is_file():
-                    zf.write(path, path.relative_to(work).as_posix())
-        out_zip.seek(0)
-        return send_file(out_zip, mimetype='application/zip', as_attachment=True, download_name='dist.zip')
+
+        try:
+            result = build_recipes(pdfs, work / 'images', work / 'mix_panels', tpl_path, work / 'out',
+                                   units=units, site_base_url=site_base_url, emit_jsonld=emit_jsonld,
+                                   usda_key=usda_key or None, pinned=pinned, mode=mode, uploads=uploads)
+        except BuildStopped as e:
+            return _error_page(e.problems)
+        problems = rejected + result['problems']
+
+        if mode == 'validate':
+            msg = f"Checked {len(pdfs)} recipe(s): " + (f"{len(problems)} problem(s) found." if problems else "no problems found.")
+            return render_template('index.html', message=msg, success=not problems, download_url=None, problems=problems)
+        if not result['built']:
+            return _error_page(problems or [problem(None, 'empty_batch', "No recipes were built.")])
+
+        if rejected:
+            (work / 'out' / 'problems.json').write_text(json.dumps(problems, indent=2), encoding='utf-8')
+        out_zip = write_archive(work / 'out')
+        resp = send_file(out_zip, mimetype='application/zip', as_attachment=True, download_name='dist.zip')
+        resp.headers['X-Problem-Count'] = str(len(problems))
+        return resp
+    except HTTPException:
+        raise  # e.g. UploadTooLarge: keep its 413 status
     except Exception as e:
         app.logger.exception('Generate failed')
         return render_template('index.html', message=str(e), success=False, download_url=None)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+_import_ms = (time.perf_counter() - _IMPORT_T0) * 1000
+if _import_ms > IMPORT_BUDGET_MS:
+    app.logger.warning('app import took %.0f ms (budget %.0f ms)', _import_ms, IMPORT_BUDGET_MS)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=7860, debug=True)
@@ -0,0 +1,11 @@
+# Picked up automatically by gunicorn from the working directory; the
+# Dockerfile CMD flags still set bind/workers/threads/timeout.
+
+# Import app.py once in the master; workers fork from it and share its pages.
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded import, before workers spawn.
+    from app import warm
+    server.log.info('Warmed shared state in %.0f ms', warm())
@@ -0,0 +1,251 @@
+from __future__ import annotations
+import contextlib, io, json, pathlib, re, shutil, zipfile
+from typing import Dict, Any, List, Optional, Iterable
+
+from .parsers import parse_recipe_pdf
+from .units import density_used, to_grams, unit_factors
+from .resolve import resolve_ingredients, write_manifest
+from .images import compress_to_webp, check_image
+from .ingest import open_buffer
+from .render import render_html, make_json_ld
+
+# The recipe pipeline shared by the Flask app and the shard CLI:
+# PDFs -> parsed recipes -> one batch resolution -> per-recipe pages.
+
+ROUND = 1
+MODES = ('stop', 'continue', 'validate')
+MACRO_KEYS = ('calories','fat_g','carbs_g','fiber_g','protein_g')
+
+CLEAN_RX = re.compile(r'\b(chopped|minced|diced|sliced|fresh|raw|peeled|ground)\b', re.I)
+
+def _clean_name(s: str) -> str:
+    s = re.sub(r'\(.*?\)', '', s)
+    s = s.split(',')[0]
+    s = CLEAN_RX.sub('', s)
+    s = re.sub(r'\s+', ' ', s)
+    return s.strip()
+
+def slugish(s: str) -> str:
+    s = s.lower()
+    s = re.sub(r'[^a-z0-9]+', '-', s)
+    return re.sub(r'-+', '-', s).strip('-')
+
+def find_image_for(stem: str, images_dir: pathlib.Path):
+    """Return the first image whose stem matches the PDF's stem (case-insensitive, punctuation-insensitive)."""
+    want = slugish(stem)
+    for p in images_dir.iterdir():
+        if not p.is_file():
+            continue
+        if p.suffix.lower() not in ('.webp','.jpg','.jpeg','.png'):
+            continue
+        if slugish(p.stem) == want:
+            return p
+    return None
+
+def multiply_per100(per100: Dict[str, float], grams: float) -> Dict[str, float]:
+    f = grams / 100.0
+    return {k: (round(v * f, ROUND) if v is not None else None) for k,v in per100.items()}
+
+def sum_macros(items: List[Dict[str, float]]) -> Dict[str, float]:
+    out = {k: 0.0 for k in MACRO_KEYS}
+    for it in items:
+        for k in MACRO_KEYS:
+            v = it.get(k)
+            if v is not None:
+                out[k] += v
+    return {k: round(v, ROUND) for k,v in out.items()}
+
+def compute_net(per_serving: Dict[str, float]) -> Optional[float]:
+    c = per_serving.get('carbs_g')
+    f = per_serving.get('fiber_g')
+    if c is None or f is None: return None
+    return round(c - f, ROUND)
+
+def _open_source(path: pathlib.Path, uploads: Dict[pathlib.Path, Dict[str, Any]]):
+    """Context manager yielding the ingested buffer for an uploaded path, else the path itself."""
+    return open_buffer(uploads[path]) if path in uploads else contextlib.nullcontext(path)
+
+# --- Problems -----------------------------------------------------------------
+
+def problem(recipe: Optional[str], kind: str, message: str, **extra) -> Dict[str, Any]:
+    return {'recipe': recipe, 'kind': kind, 'message': message, **extra}
+
+class BuildStopped(ValueError):
+    """Raised in 'stop' mode at the first problem; carries the problems seen so far."""
+
+    def __init__(self, problems: List[Dict[str, Any]]):
+        super().__init__(problems)  # args stay the problems, so the exception pickles (shard process pools)
+        self.problems = problems
+
+    def __str__(self) -> str:
+        return self.problems[-1]['message']
+
+# --- Build --------------------------------------------------------------------
+
+def build_recipes(pdfs: Iterable[pathlib.Path], images_dir: pathlib.Path, panels_dir: pathlib.Path,
+                  tpl_path: pathlib.Path, out_dir: pathlib.Path, *, units: str = 'us',
+                  site_base_url: Optional[str] = None, emit_jsonld: bool = True,
+                  usda_key: Optional[str] = None, pinned: Optional[Dict[str, Any]] = None,
+                  mode: str = 'stop', uploads: Optional[Dict[pathlib.Path, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Build recipe pages under out_dir/recipes/<stem>/ plus out_dir/resolution.json.
+
+    mode: 'stop' raises BuildStopped at the first problem, 'continue' skips
+    recipes with problems and builds the rest, 'validate' only collects
+    problems (images are checked but not encoded, nothing is rendered).
+    `uploads` maps paths to ingest records so files are read from their
+    in-memory/mmap buffers.
+    Returns {'built': [stems], 'problems': [...], 'resolution': {...}}.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown build mode: {mode!r}")
+    uploads = uploads or {}
+    pdfs = list(pdfs)
+    problems: List[Dict[str, Any]] = []
+
+    def report(p: Dict[str, Any], pending: List[Dict[str, Any]]):
+        pending.append(p)
+        if mode == 'stop':
+            raise BuildStopped(problems if pending is problems else problems + pending)
+
+    recipes = []
+    for pdf in pdfs:
+        stem = pdf.stem
+        img = find_image_for(stem, images_dir)
+        if not img:
+            report(problem(stem, 'missing_image', f"No image found for {stem}."), problems)
+        try:
+            with _open_source(pdf, uploads) as src:
+                parsed = parse_recipe_pdf(pdf, source=src)
+        except Exception as e:
+            report(problem(stem, 'unparseable_pdf', str(e)), problems)
+            continue
+        recipes.append((stem, img, parsed))
+
+    def panel_failed(panel: pathlib.Path, e: Exception):
+        report(problem(None, 'panel_error', f"Could not read mix panel {panel.name}: {e}", panel=panel.name), problems)
+
+    # Each distinct ingredient name is resolved once for the whole batch.
+    resolution = resolve_ingredients((_clean_name(ing['name']) for _, _, parsed in recipes for ing in parsed['ingredients']),
+                                     panels_dir, usda_key=usda_key or None, pinned=pinned,
+                                     digests={p: e['sha256'] for p, e in uploads.items()},
+                                     on_panel_error=panel_failed)
+
+    # Gram conversions for the whole batch at once; each (ingredient, unit)
+    # factor is looked up a single time. Pinned names never consult the live
+    # density tables: they use their pinned factors, else their pinned density
+    # (an empty one if none was recorded).
+    lines = [(_clean_name(ing['name']), ing['amount'], ing['unit'])
+             for _, _, parsed in recipes for ing in parsed['ingredients']
+             if resolution.get(_clean_name(ing['name'])) and ing.get('amount') and ing.get('unit')]
+    pins = {name: rec for name, rec in resolution.items() if rec and rec.get('pinned')}
+    densities = {n: rec.get('density') or {} for n, rec in pins.items()}
+    factors = {n: rec.get('grams_per_unit') or {} for n, rec in pins.items()}
+    grams = dict(zip(lines, to_grams(lines, densities, factors)))
+
+    # Record the factors those conversions applied, and the table density
+    # behind any volume conversion, so the manifest pins both.
+    for (name, canon), f in unit_factors(((n, u) for n, _, u in lines), densities, factors).items():
+        if f is None:
+            continue
+        rec = resolution[name]
+        rec['grams_per_unit'] = {**rec.get('grams_per_unit', {}), canon: f}
+        dens = None if rec.get('pinned') else density_used(name, canon)
+        if dens:
+            rec['density'] = dens
+    write_manifest(out_dir / 'resolution.json', resolution)
+
+    built: List[str] = []
+    for stem, img, parsed in recipes:
+        servings = parsed['servings']
+        recipe_problems: List[Dict[str, Any]] = []
+
+        nutrient_items = []
+        normalized_ings = []
+        for ing in parsed['ingredients']:
+            qname = _clean_name(ing['name'])
+            rec = resolution.get(qname)
+            if not rec:
+                report(problem(stem, 'unresolved_ingredient', f"Missing nutrition data for '{ing['name']}'. Add override/mix or provide USDA key.", ingredient=ing['name']), recipe_problems)
+                continue
+            per100 = rec['per_100g']
+
+            g = 0.0
+            if ing.get('amount') and ing.get('unit'):
+                g = grams.get((qname, ing['amount'], ing['unit'])) or 0.0
+                if g == 0.0 and ing.get('unit') not in ('','g','kg'):
+                    report(problem(stem, 'unconvertible_unit', f"Need density for {ing['name']} to convert {ing['amount']} {ing['unit']} to grams.", ingredient=ing['name'], unit=ing['unit']), recipe_problems)
+                    continue
+
+            amt_macros = multiply_per100(per100, g) if g else {k: 0.0 for k in MACRO_KEYS}
+            nutrient_items.append(amt_macros)
+
+            disp = f"{ing['name']} — {int(round(g))} g" if units=='metric' and g>0 else \
+                   (f"{ing['name']} — {ing['amount']:g} {ing['unit']}" if ing.get('amount') and ing.get('unit') else ing['name'])
+            normalized_ings.append({**ing, 'amount_g': g, 'display': disp})
+
+        problems.extend(recipe_problems)
+        if recipe_problems or not img:
+            continue
+        if mode == 'validate':
+            try:
+                with _open_source(img, uploads) as src:
+                    check_image(src)
+            except Exception as e:
+                report(problem(stem, 'image_error', f"Could not read image {img.name}: {e}"), problems)
+            continue
+
+        totals = sum_macros(nutrient_items)
+        per_serving = {k: round(v/servings, ROUND) for k,v in totals.items()}
+        per_serving['net_carbs_g'] = compute_net(per_serving)
+
+        recipe_dir = out_dir / 'recipes' / stem
+        recipe_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            with _open_source(img, uploads) as src:
+                compress_to_webp(src, recipe_dir / 'image.webp')
+        except Exception as e:
+            shutil.rmtree(recipe_dir, ignore_errors=True)
+            report(problem(stem, 'image_error', f"Could not encode image {img.name}: {e}"), problems)
+            continue
+
+        context = {
+            'title': stem.replace('-', ' ').title(),
+            'description': '',
+            'canonical_url': None if not site_base_url else f"{site_base_url.rstrip('/')}/recipes/{stem}/",
+            'image': 'image.webp',
+            'servings': servings,
+            'ingredients': normalized_ings,
+            'instructions': parsed['instructions'],
+            'nutrition_per_serving': per_serving,
+            'emit_jsonld': emit_jsonld,
+            'json_ld': make_json_ld({
+                'title': stem.replace('-', ' ').title(),
+                'image': 'image.webp',
+                'servings': servings,
+                'nutrition_per_serving': per_serving
+            }) if emit_jsonld else ""
+        }
+
+        try:
+            html = render_html(tpl_path, context)
+        except Exception as e:
+            shutil.rmtree(recipe_dir, ignore_errors=True)
+            report(problem(stem, 'render_error', f"Could not render {stem}: {e}"), problems)
+            continue
+        (recipe_dir / 'index.html').write_text(html, encoding='utf-8')
+        built.append(stem)
+
+    if problems and mode != 'validate':
+        (out_dir / 'problems.json').write_text(json.dumps(problems, indent=2), encoding='utf-8')
+    return {'built': built, 'problems': problems, 'resolution': resolution}
+
+def write_archive(out_dir: pathlib.Path, arc_root: str = 'out') -> io.BytesIO:
+    """Zip everything under out_dir, with entries rooted at `arc_root/`."""
+    out_zip = io.BytesIO()
+    with zipfile.ZipFile(out_zip, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for path in sorted(out_dir.rglob('*')):
+            if path.is_file():
+                zf.write(path, f"{arc_root}/{path.relative_to(out_dir).as_posix()}")
+    out_zip.seek(0)
+    return out_zip
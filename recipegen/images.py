@@ -1,8 +1,9 @@
 from __future__ import annotations
 import pathlib
-from PIL import Image
 
-def compress_to_webp(src: pathlib.Path, dst: pathlib.Path, max_side=1600, quality=80):
+def compress_to_webp(src, dst: pathlib.Path, max_side=1600, quality=80):
+    """`src` may be a path or an open binary buffer (bytes/mmap)."""
+    from PIL import Image
     img = Image.open(src).convert('RGB')
     w, h = img.size
     scale = min(1.0, float(max_side)/max(w,h))
@@ -11,3 +12,9 @@ def compress_to_webp(src: pathlib.Path, dst: pathlib.Path, max_side=1600, qualit
     dst.parent.mkdir(parents=True, exist_ok=True)
     img.save(dst, format='WEBP', quality=80, method=6)
     return dst
+
+def check_image(src):
+    """Raise if `src` (path or buffer) is not a readable image; decodes nothing beyond the headers."""
+    from PIL import Image
+    with Image.open(src) as img:
+        img.verify()
@@ -0,0 +1,184 @@
+from __future__ import annotations
+import codecs, contextlib, hashlib, io, mmap, os, pathlib, shutil, tempfile
+from typing import Dict, Any, Optional, Iterable
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+# Uploads are streamed through IngestStream as werkzeug parses the multipart
+# body, so hashing, type sniffing and size limits happen chunk by chunk and a
+# single oversized part is rejected before it is fully written anywhere.
+# Small parts stay in memory; larger ones roll over into a temp file in
+# `spool_dir`, which save_upload() then moves into place rather than copies.
+
+SPOOL_BYTES = 1024 * 1024                      # parts up to this size stay in memory
+MAX_FILE_BYTES = int(os.getenv('MAX_FILE_MB', '25')) * 1024 * 1024
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_MB', '150')) * 1024 * 1024
+
+EXT_FOR_KIND = {'pdf': '.pdf', 'png': '.png', 'jpeg': '.jpg', 'webp': '.webp'}
+IMAGE_KINDS = ('png', 'jpeg', 'webp')
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    # Not a ValueError: werkzeug's form parser silently swallows those.
+    pass
+
+
+def sniff_kind(head: bytes) -> Optional[str]:
+    """Identify the real file type from its first bytes; None if unrecognised."""
+    if head.startswith(b'%PDF-'):
+        return 'pdf'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head and b'\x00' not in head:
+        try:
+            # incremental: a multi-byte character may straddle the end of the sniff window
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        except UnicodeDecodeError:
+            return None
+        return 'text'
+    return None
+
+
+class UploadBudget:
+    """Bytes remaining for one request, shared by all of its file parts."""
+
+    def __init__(self, max_bytes: int = MAX_REQUEST_BYTES):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def charge(self, n: int):
+        self.used += n
+        if self.used > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB request limit.")
+
+
+class IngestStream(io.RawIOBase):
+    """Writable spool that hashes, sniffs and size-checks each chunk as it arrives."""
+
+    def __init__(self, budget: UploadBudget, filename: Optional[str] = None,
+                 max_bytes: int = MAX_FILE_BYTES, spool_dir: Optional[pathlib.Path] = None):
+        super().__init__()
+        self.budget = budget
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.spool_dir = spool_dir
+        self.size = 0
+        self.kind: Optional[str] = None
+        self._sha = hashlib.sha256()
+        self._head = b''
+        self._spool = io.BytesIO()
+        self._spool_path: Optional[str] = None   # set once rolled over to disk
+
+    def writable(self): return True
+    def readable(self): return True
+    def seekable(self): return True
+
+    def write(self, data) -> int:
+        n = len(data)
+        self.size += n
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"{self.filename or 'Upload'} exceeds the {self.max_bytes // (1024 * 1024)} MB file limit.")
+        self.budget.charge(n)
+        self._sha.update(data)
+        if len(self._head) < 16:
+            self._head += bytes(data[:16 - len(self._head)])
+            self.kind = sniff_kind(self._head)
+        if self._spool_path is None and self.size > SPOOL_BYTES:
+            self._rollover()
+        return self._spool.write(data)
+
+    def _rollover(self):
+        fd, self._spool_path = tempfile.mkstemp(prefix='.ingest-', dir=self.spool_dir)
+        disk = os.fdopen(fd, 'w+b')
+        disk.write(self._spool.getbuffer())
+        self._spool = disk
+
+    def readinto(self, b) -> int:
+        data = self._spool.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._spool.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._spool.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._spool.tell()
+
+    def close(self):
+        self._spool.close()
+        if self._spool_path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self._spool_path)
+        super().close()
+
+    def move_to(self, dest: pathlib.Path):
+        """Move a rolled-over spool file to dest (a rename on the same filesystem)."""
+        self._spool.flush()
+        shutil.move(self._spool_path, dest)
+        self._spool.close()
+        self._spool = open(dest, 'rb')
+        self._spool_path = None
+
+    @property
+    def sha256(self) -> str:
+        return self._sha.hexdigest()
+
+    @property
+    def in_memory(self) -> bool:
+        return isinstance(self._spool, io.BytesIO)
+
+    def getvalue(self) -> bytes:
+        if self.in_memory:
+            return self._spool.getvalue()
+        self.seek(0)
+        return self.read()
+
+
+def save_upload(storage, dest_dir: pathlib.Path, accept: Iterable[str]) -> Optional[Dict[str, Any]]:
+    """
+    Materialize one streamed part into dest_dir if its sniffed type is in `accept`.
+
+    Binary files get the extension of their real type; text files (templates,
+    YAML tables) keep the uploaded one. Returns a record with path, kind, size,
+    sha256 and (for small parts) the bytes themselves, or None when the part is
+    empty or of an unaccepted type.
+    """
+    stream = storage.stream
+    if not isinstance(stream, IngestStream) or stream.kind not in accept:
+        return None
+    orig = pathlib.Path(secure_filename(storage.filename or '') or 'upload')
+    ext = EXT_FOR_KIND.get(stream.kind, orig.suffix.lower())
+    dest = dest_dir / (orig.stem + ext)
+    data = stream.getvalue() if stream.in_memory else None
+    if data is not None:
+        dest.write_bytes(data)
+    else:
+        stream.move_to(dest)
+    return {
+        'path': dest,
+        'kind': stream.kind,
+        'size': stream.size,
+        'sha256': stream.sha256,
+        'data': data,
+    }
+
+
+@contextlib.contextmanager
+def open_buffer(entry: Dict[str, Any]):
+    """Readable binary buffer for an ingested file: in-memory bytes or a read-only mmap, closed on exit."""
+    if entry.get('data') is not None or entry['size'] == 0:
+        yield io.BytesIO(entry.get('data') or b'')
+        return
+    with open(entry['path'], 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield buf
+    finally:
+        buf.close()
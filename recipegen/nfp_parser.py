@@ -1,9 +1,10 @@
 from __future__ import annotations
-import re, pathlib
-from typing import Dict, Any
-import pdfplumber
-from PIL import Image
-import pytesseract
+import hashlib, os, re, pathlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Any, Callable, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 NUM = r'([0-9]+(?:\.[0-9]+)?)'
 
@@ -15,6 +16,7 @@ FIB_RE  = re.compile(r'(dietary\s*fiber|fiber)[^0-9]*' + NUM + '\s*g', re.I)
 PROT_RE = re.compile(r'protein[^0-9]*' + NUM + '\s*g', re.I)
 
 def _extract_text_pdf(pdf_path: pathlib.Path) -> str:
+    import pdfplumber
     blocks = []
     with pdfplumber.open(str(pdf_path)) as pdf:
         for page in pdf.pages:
@@ -22,9 +24,52 @@ def _extract_text_pdf(pdf_path: pathlib.Path) -> str:
             blocks.append(t)
     return "\n".join(blocks)
 
+# --- OCR ----------------------------------------------------------------------
+
+OCR_MAX_SIDE = 1800          # panels are small text; more pixels only slow tesseract
+OCR_THRESHOLD = 150          # gray level separating ink from background
+OCR_WHITELIST = ('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+                 '0123456789%.,()/:<-')
+# psm 6 = single uniform block of text, which is what a cropped panel is.
+OCR_FAST_CONFIG = f'--oem 1 --psm 6 -c tessedit_char_whitelist={OCR_WHITELIST}'
+OCR_FULL_CONFIG = '--oem 1 --psm 3'
+
+REQUIRED_RES = (SERV_RE, CAL_RE, FAT_RE, CARB_RE, PROT_RE)
+
+def _binarize(gray: Image.Image) -> Image.Image:
+    return gray.point(lambda v: 255 if v > OCR_THRESHOLD else 0, mode='1')
+
+def _preprocess_panel(img: Image.Image) -> Image.Image:
+    """Grayscale, crop to the inked area of the panel, then downsize and binarize."""
+    from PIL import Image, ImageOps
+    img = ImageOps.exif_transpose(img)
+    gray = ImageOps.autocontrast(img.convert('L'))
+    # Crop before scaling, so a panel filling part of a photo keeps its resolution.
+    bbox = ImageOps.invert(_binarize(gray).convert('L')).getbbox()
+    if bbox:
+        pad = 10
+        bbox = (max(0, bbox[0] - pad), max(0, bbox[1] - pad),
+                min(gray.width, bbox[2] + pad), min(gray.height, bbox[3] + pad))
+        gray = gray.crop(bbox)
+    w, h = gray.size
+    scale = min(1.0, float(OCR_MAX_SIDE) / max(w, h))
+    if scale < 1.0:
+        gray = gray.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+    return _binarize(gray)
+
+def _looks_complete(text: str) -> bool:
+    return all(rx.search(text) for rx in REQUIRED_RES)
+
 def _extract_text_image(img_path: pathlib.Path) -> str:
-    img = Image.open(img_path)
-    return pytesseract.image_to_string(img)
+    """Fast OCR pass on a cleaned-up panel; full-quality OCR only if the regexes miss."""
+    from PIL import Image
+    import pytesseract
+    with Image.open(img_path) as img:
+        img.load()
+        text = pytesseract.image_to_string(_preprocess_panel(img), config=OCR_FAST_CONFIG)
+        if _looks_complete(text):
+            return text
+        return pytesseract.image_to_string(img, config=OCR_FULL_CONFIG)
 
 def extract_panel_text(path: pathlib.Path) -> str:
     ext = path.suffix.lower()
@@ -35,6 +80,56 @@ def extract_panel_text(path: pathlib.Path) -> str:
     else:
         raise ValueError(f"Unsupported panel file: {path}")
 
+# Extracted text keyed by the panel's content sha256, so re-uploading the same
+# panel (under any name) skips OCR.
+_TEXT_CACHE: Dict[str, str] = {}
+TEXT_CACHE_MAX = 256
+
+def _file_sha256(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _try_extract(path: pathlib.Path):
+    try:
+        return extract_panel_text(path), None
+    except Exception as e:
+        return None, e
+
+def extract_panel_texts(paths: Iterable[pathlib.Path], max_workers: Optional[int] = None,
+                        digests: Optional[Dict[pathlib.Path, str]] = None,
+                        on_error: Optional[Callable[[pathlib.Path, Exception], None]] = None) -> Dict[pathlib.Path, str]:
+    """
+    Extract text for many panels in parallel (tesseract runs as a subprocess, so threads use all cores).
+    `digests` gives known content hashes (e.g. from ingest); others are hashed here.
+    A panel that fails is passed to `on_error` and left out of the result; without
+    `on_error` the first failure is raised.
+    """
+    paths: List[pathlib.Path] = list(paths)
+    if not paths:
+        return {}
+    keys = {p: (digests or {}).get(p) or _file_sha256(p) for p in paths}
+    out = {p: _TEXT_CACHE[keys[p]] for p in paths if keys[p] in _TEXT_CACHE}
+    todo = [p for p in paths if p not in out]
+    if todo:
+        # One tesseract per panel already fills the cores; don't let each also spawn OpenMP threads.
+        os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+        workers = max_workers or min(len(todo), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(zip(todo, pool.map(_try_extract, todo)))
+        if len(_TEXT_CACHE) + len(todo) > TEXT_CACHE_MAX:
+            _TEXT_CACHE.clear()
+        for p, (text, err) in results:
+            if err is not None:
+                if on_error is None:
+                    raise err
+                on_error(p, err)
+                continue
+            out[p] = _TEXT_CACHE[keys[p]] = text
+    return out
+
 def parse_nfp_text_to_per100g(text: str) -> Dict[str, Any]:
     def _grab(rx, idx=1, default=None, cast=float):
         m = rx.search(text)
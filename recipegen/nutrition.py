@@ -1,27 +1,56 @@
 from __future__ import annotations
-from typing import Optional, Dict
-import yaml, pathlib
+from functools import lru_cache
+from typing import Optional, Dict, List, Tuple
+import pathlib
 from .builtins import BUILTIN_OVERRIDES
-from rapidfuzz import process, fuzz
 
 DATA = pathlib.Path(__file__).resolve().parent.parent / 'data'
 
+# yaml and rapidfuzz are imported on first use so that importing this module
+# (and serving '/') stays cheap; warm() in app.py pulls them in ahead of time.
+
+def _mtime(p: pathlib.Path) -> int:
+    try:
+        return p.stat().st_mtime_ns
+    except OSError:
+        return 0
+
 def load_yaml(p: pathlib.Path) -> dict:
+    import yaml
     return yaml.safe_load(p.read_text()) if p.exists() else {}
 
+@lru_cache(maxsize=4)
+def _load_yaml_cached(p: pathlib.Path, mtime: int) -> dict:
+    return load_yaml(p) or {}
+
 def load_overrides() -> dict:
-    return load_yaml(DATA / 'ingredient_overrides.yml')
+    p = DATA / 'ingredient_overrides.yml'
+    return _load_yaml_cached(p, _mtime(p))
 
 def load_mix_map() -> dict:
-    return load_yaml(DATA / 'mix_map.yml')
+    p = DATA / 'mix_map.yml'
+    return _load_yaml_cached(p, _mtime(p))
+
+@lru_cache(maxsize=4)
+def _override_index(mtime: int) -> Tuple[dict, List[str]]:
+    """Built-ins merged with the YAML overrides, plus the key list fuzzy matching scans."""
+    ov = {**BUILTIN_OVERRIDES, **(load_overrides() or {})}
+    return ov, list(ov.keys())
 
-def fuzzy_get(mapping: dict, name: str, threshold=90):
+def merged_overrides() -> Tuple[dict, List[str]]:
+    return _override_index(_mtime(DATA / 'ingredient_overrides.yml'))
+
+def fuzzy_key(mapping: dict, name: str, threshold=90, keys: Optional[List[str]] = None) -> Optional[str]:
     if not mapping: return None
-    keys = list(mapping.keys())
-    best = process.extractOne(name, keys, scorer=fuzz.WRatio)
+    from rapidfuzz import process, fuzz
+    best = process.extractOne(name, keys if keys is not None else list(mapping.keys()), scorer=fuzz.WRatio)
     if not best: return None
     match, score, _ = best
-    return mapping[match] if score >= threshold else None
+    return match if score >= threshold else None
+
+def fuzzy_get(mapping: dict, name: str, threshold=90, keys: Optional[List[str]] = None):
+    k = fuzzy_key(mapping, name, threshold=threshold, keys=keys)
+    return mapping[k] if k is not None else None
 
 def choose_mix_id(ingredient_name: str) -> Optional[str]:
     m = load_mix_map()
@@ -30,11 +59,18 @@ def choose_mix_id(ingredient_name: str) -> Optional[str]:
     if isinstance(val, str): return val
     return None
 
+def override_lookup(ingredient_name: str) -> Optional[Tuple[str, Dict[str, float]]]:
+    """Return ('override' | 'builtin', per_100g) for the matching pantry entry, if any."""
+    ov, keys = merged_overrides()
+    key = next((k for k in (ingredient_name, ingredient_name.lower()) if ov.get(k)), None)
+    if key is None:
+        key = fuzzy_key(ov, ingredient_name, threshold=92, keys=keys)
+    if key is None: return None
+    hit = ov[key]
+    if 'per_100g' not in hit: return None
+    source = 'override' if key in (load_overrides() or {}) else 'builtin'
+    return source, hit['per_100g']
+
 def override_per100(ingredient_name: str) -> Optional[Dict[str, float]]:
-    ov = {**BUILTIN_OVERRIDES, **(load_overrides() or {})}
-    hit = ov.get(ingredient_name) or ov.get(ingredient_name.lower())
-    if not hit:
-        hit = fuzzy_get(ov, ingredient_name, threshold=92)
-    if not hit: return None
-    if 'per_100g' in hit: return hit['per_100g']
-    return None
+    hit = override_lookup(ingredient_name)
+    return hit[1] if hit else None
@@ -1,8 +1,9 @@
 from __future__ import annotations
 import re
 import pathlib
-import pdfplumber
-from typing import List, Dict, Any
+from typing import List, Dict, Any, BinaryIO, Optional, Union
+
+from .units import UNIT_ALIASES, SIZE_UNITS
 
 # --- Section detection --------------------------------------------------------
 
@@ -40,9 +41,11 @@ def looks_like_subheader(line: str) -> bool:
 
 # --- PDF helpers --------------------------------------------------------------
 
-def read_pdf_text(pdf_path: pathlib.Path) -> str:
+def read_pdf_text(pdf_path: Union[pathlib.Path, BinaryIO]) -> str:
+    """Extract text from a PDF given as a path or an open binary buffer (bytes/mmap)."""
+    import pdfplumber
     chunks: List[str] = []
-    with pdfplumber.open(str(pdf_path)) as pdf:
+    with pdfplumber.open(pdf_path if hasattr(pdf_path, 'read') else str(pdf_path)) as pdf:
         for page in pdf.pages:
             t = page.extract_text() or ""
             t = t.replace('\u2022', '-')  # normalize bullets
@@ -51,9 +54,11 @@ def read_pdf_text(pdf_path: pathlib.Path) -> str:
 
 # --- Ingredient line parsing --------------------------------------------------
 
+UNIT_ALT = r'(cups?|c|tablespoons?|tbsps?|tbs|teaspoons?|tsps?|grams?|g|kg|kilograms?|fl\.?\s*oz|fluid\s+ounces?|ounces?|oz|pounds?|lbs?|milliliters?|millilitres?|ml|liters?|litres?|l)'
+
 ING_LINE_PATTERNS = [
-    re.compile(r'^\s*[-•]?\s*(.+?)\s+([0-9]+(?:\.[0-9]+)?)\s*(cups?|cup|c|tablespoons?|tbsp|teaspoons?|tsp|grams?|g|kg)\s*$', re.I),
-    re.compile(r'^\s*[-•]?\s*([0-9]+(?:\.[0-9]+)?)\s*(cups?|cup|c|tablespoons?|tbsp|teaspoons?|tsp|grams?|g|kg)\s+(.+?)\s*$', re.I),
+    re.compile(r'^\s*[-•]?\s*(.+?)\s+([0-9]+(?:\.[0-9]+)?)\s*' + UNIT_ALT + r'\s*$', re.I),
+    re.compile(r'^\s*[-•]?\s*([0-9]+(?:\.[0-9]+)?)\s*' + UNIT_ALT + r'\s+(.+?)\s*$', re.I),
     re.compile(r'^\s*[-•]?\s*(.+?)\s*$', re.I),
 ]
 
@@ -83,7 +88,11 @@ def _to_float_amount(txt: str):
     except Exception:
         return None
 
-UNIT_RX = r'(cups?|cup|c|tablespoons?|tbsp|teaspoons?|tsp|grams?|g|kg|milliliters?|ml)'
+UNIT_RX = UNIT_ALT
+
+# Every spelling of a size/count unit ('cloves', 'med', 'lg', ...), longest first.
+SIZE_ALT = '(' + '|'.join(sorted((re.escape(s) for s, canon in UNIT_ALIASES.items() if canon in SIZE_UNITS),
+                                 key=len, reverse=True)) + ')'
 
 def tolerant_amount_unit_name(line: str):
     """Parse lines like '1/2 tablespoon of vegetable oil' or '1 1/2 cups almond flour'."""
@@ -99,7 +108,7 @@ def tolerant_amount_unit_name(line: str):
 
 def tolerant_amount_size_name(line: str):
     # e.g., "1/2 medium onion, chopped" or "2 large eggs"
-    m = re.match(r'^\s*[-•]?\s*([\d]+(?:\.[\d]+)?(?:\s+[\d]+/[\d]+)?|[\d]+/[\d]+|[¼½¾⅐⅑⅒⅓⅔⅕⅖⅗⅘⅙⅚⅛⅜⅝⅞])\s*(small|medium|large|clove|each|whole)\s+(.+?)\s*$', line, re.I)
+    m = re.match(r'^\s*[-•]?\s*([\d]+(?:\.[\d]+)?(?:\s+[\d]+/[\d]+)?|[\d]+/[\d]+|[¼½¾⅐⅑⅒⅓⅔⅕⅖⅗⅘⅙⅚⅛⅜⅝⅞])\s*' + SIZE_ALT + r'\s+(.+?)\s*$', line, re.I)
     if not m:
         return None
     amt_txt, size, name = m.group(1), m.group(2), m.group(3)
@@ -138,8 +147,9 @@ def parse_ingredient_line(line: str):
 
 # --- High-level PDF -> structured recipe -------------------------------------
 
-def parse_recipe_pdf(pdf_path: pathlib.Path) -> Dict[str, Any]:
-    text = read_pdf_text(pdf_path)
+def parse_recipe_pdf(pdf_path: pathlib.Path, source: Optional[BinaryIO] = None) -> Dict[str, Any]:
+    """Parse a recipe PDF; `source` (an already-open buffer) is read instead of the path when given."""
+    text = read_pdf_text(source if source is not None else pdf_path)
     lines = [l.strip() for l in text.splitlines() if l.strip()]
     servings = None
     ingredients: List[Dict[str, Any]] = []
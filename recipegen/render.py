@@ -1,16 +1,22 @@
 from __future__ import annotations
 from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
 import json, pathlib
+from functools import lru_cache
 
-def jinja_env(template_path: pathlib.Path) -> Environment:
+@lru_cache(maxsize=8)
+def _cached_env(template_dir: str, mtime_ns: int) -> Environment:
+    # keyed on the template's mtime so a re-uploaded template never renders stale
     return Environment(
-        loader=FileSystemLoader(str(template_path.parent)),
+        loader=FileSystemLoader(template_dir),
         autoescape=select_autoescape(['html','xml']),
         undefined=StrictUndefined,
         trim_blocks=True,
         lstrip_blocks=True,
     )
 
+def jinja_env(template_path: pathlib.Path) -> Environment:
+    return _cached_env(str(template_path.parent), template_path.stat().st_mtime_ns)
+
 def render_html(template_path: pathlib.Path, context):
     env = jinja_env(template_path)
     tpl = env.get_template(template_path.name)
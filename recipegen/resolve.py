@@ -0,0 +1,106 @@
+from __future__ import annotations
+import json, pathlib
+from typing import Dict, Any, Callable, Iterable, Optional
+
+from .nutrition import override_lookup, choose_mix_id
+from .nfp_parser import extract_panel_texts, parse_nfp_text_to_per100g
+from . import usda
+
+# A resolution manifest records, per cleaned ingredient name, where its
+# nutrition came from, the grams per unit that were applied to convert it
+# (whatever the basis: mass, size weight, density table or the 1 g/ml water
+# fallback) and, when a volume unit went through the density table, that
+# density record. build_recipes fills in the last two:
+#
+#   {"version": 1, "ingredients": {
+#       "olive oil":   {"source": "builtin",  "per_100g": {...}, "grams_per_unit": {"tablespoon": 13.5},
+#                       "density": {"tbsp_g": 13.5, "tsp_g": 4.5, "cup_g": 216}},
+#       "keto bread":  {"source": "mix",      "mix_id": "bread-mix", "panel": "bread-mix.png", ...},
+#       "almond milk": {"source": "usda",     "fdc_id": 1097551, "description": "...", ...}}}
+#
+# Loading it back as `pinned` skips resolution for those names, so a rebuild
+# reproduces the same numbers even if overrides or USDA data have changed.
+
+MANIFEST_VERSION = 1
+PANEL_EXTS = ('.pdf', '.png', '.jpg', '.jpeg', '.webp')
+
+
+def _find_panel(panels_dir: pathlib.Path, mix_id: str) -> Optional[pathlib.Path]:
+    for ext in PANEL_EXTS:
+        q = panels_dir / f"{mix_id}{ext}"
+        if q.exists():
+            return q
+    return None
+
+
+def resolve_ingredients(names: Iterable[str], panels_dir: pathlib.Path, usda_key: Optional[str] = None,
+                        pinned: Optional[Dict[str, Dict[str, Any]]] = None,
+                        digests: Optional[Dict[pathlib.Path, str]] = None,
+                        on_panel_error: Optional[Callable[[pathlib.Path, Exception], None]] = None
+                        ) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Resolve each distinct cleaned name once: pinned manifest -> override/builtin -> mix panel -> USDA.
+    `digests` maps panel paths to known content hashes, which key the OCR text cache.
+    A panel that cannot be read goes to `on_panel_error` (raised if None) and
+    its names fall back to USDA.
+
+    Returns name -> record (see module comment), or None for names nothing could resolve.
+    """
+    unique = list(dict.fromkeys(names))
+    out: Dict[str, Optional[Dict[str, Any]]] = {}
+    pending = []
+    for name in unique:
+        if pinned and name in pinned:
+            out[name] = {**pinned[name], 'pinned': True}
+            continue
+        hit = override_lookup(name)
+        if hit:
+            out[name] = {'source': hit[0], 'per_100g': hit[1]}
+        else:
+            pending.append(name)
+
+    # Mix panels: OCR every panel that is actually needed, in parallel.
+    wanted = {}
+    for name in pending:
+        mix_id = choose_mix_id(name)
+        panel = _find_panel(panels_dir, mix_id) if mix_id else None
+        if panel:
+            wanted[name] = (mix_id, panel)
+    texts = extract_panel_texts(sorted({p for _, p in wanted.values()}), digests=digests,
+                                on_error=on_panel_error)
+
+    for name in pending:
+        if name in wanted and wanted[name][1] in texts:
+            mix_id, panel = wanted[name]
+            try:
+                per100 = parse_nfp_text_to_per100g(texts[panel])['per_100g']
+            except ValueError:
+                per100 = None  # unreadable panel: fall back to USDA below
+            if per100:
+                out[name] = {'source': 'mix', 'mix_id': mix_id, 'panel': panel.name, 'per_100g': per100}
+                continue
+        food = usda.search_food(name, api_key=usda_key or None)
+        if food:
+            out[name] = {'source': 'usda', 'fdc_id': food['fdc_id'], 'description': food.get('description'),
+                         'per_100g': food['per_100g']}
+        else:
+            out[name] = None
+    return out
+
+
+def write_manifest(path: pathlib.Path, resolved: Dict[str, Optional[Dict[str, Any]]]) -> pathlib.Path:
+    body = {
+        'version': MANIFEST_VERSION,
+        'ingredients': {k: {f: v for f, v in rec.items() if f != 'pinned'}
+                        for k, rec in sorted(resolved.items()) if rec is not None},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(body, indent=2, sort_keys=True), encoding='utf-8')
+    return path
+
+
+def load_manifest(path: pathlib.Path) -> Dict[str, Dict[str, Any]]:
+    data = json.loads(pathlib.Path(path).read_text(encoding='utf-8'))
+    if data.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported resolution manifest version: {data.get('version')!r}")
+    return data.get('ingredients') or {}
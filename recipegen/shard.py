@@ -0,0 +1,253 @@
+"""
+Sharded builds.
+
+Recipes are assigned to shards by a stable hash of their slug, so any number of
+processes or machines can each build one shard of the same input tree:
+
+    python -m recipegen.shard build INPUT --shard 0/4 --out shards/0
+    ...
+    python -m recipegen.shard merge shards/0 shards/1 shards/2 shards/3 --out dist
+    python -m recipegen.shard run INPUT --shards 4 --out dist    # all shards locally
+
+INPUT has the same layout as an upload work dir: a template .html file,
+pdfs/, images/ and (optionally) mix_panels/ and resolution.json to pin.
+Each shard writes recipes/<stem>/, resolution.json, problems.json and a
+shard-manifest.json; merge checks the manifests, copies the trees together
+and writes dist.zip.
+"""
+from __future__ import annotations
+import argparse, hashlib, json, os, pathlib, shutil, sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from .build import build_recipes, write_archive, slugish
+from .resolve import load_manifest, write_manifest
+
+SHARD_MANIFEST = 'shard-manifest.json'
+MANIFEST_VERSION = 1
+
+
+def shard_of(slug: str, count: int) -> int:
+    """Deterministic shard index for a slug (independent of PYTHONHASHSEED and machine)."""
+    return int(hashlib.sha1(slug.encode('utf-8')).hexdigest()[:8], 16) % count
+
+
+def parse_shard_spec(spec: str):
+    """'2/8' -> (2, 8)."""
+    idx, _, count = spec.partition('/')
+    index, count = int(idx), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Bad shard spec {spec!r}; expected INDEX/COUNT with 0 <= INDEX < COUNT.")
+    return index, count
+
+
+def _find_template(input_dir: pathlib.Path, template: Optional[pathlib.Path]) -> pathlib.Path:
+    if template:
+        return template
+    found = sorted(p for p in input_dir.iterdir() if p.suffix.lower() in ('.html', '.htm'))
+    if len(found) != 1:
+        raise ValueError(f"Expected exactly one .html template in {input_dir}, found {len(found)}; pass --template.")
+    return found[0]
+
+
+def _sha256(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_shard(input_dir: pathlib.Path, out_dir: pathlib.Path, index: int, count: int,
+                template: Optional[pathlib.Path] = None, mode: str = 'continue', **options) -> Dict[str, Any]:
+    """Build the recipes of one shard into out_dir and write its shard manifest."""
+    input_dir, out_dir = pathlib.Path(input_dir), pathlib.Path(out_dir)
+    if out_dir.exists():
+        if any(out_dir.iterdir()) and not (out_dir / SHARD_MANIFEST).exists():
+            raise ValueError(f"{out_dir} is not empty and is not a previous shard output; refusing to overwrite.")
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+
+    slugs: Dict[str, str] = {}
+    pdfs = []
+    for pdf in sorted((input_dir / 'pdfs').glob('*.pdf')):
+        slug = slugish(pdf.stem)
+        if shard_of(slug, count) != index:
+            continue
+        if slug in slugs:
+            raise ValueError(f"Duplicate recipe slug {slug!r}: {slugs[slug]} and {pdf.name}")
+        slugs[slug] = pdf.stem
+        pdfs.append(pdf)
+
+    pinned_path = input_dir / 'resolution.json'
+    pinned = load_manifest(pinned_path) if pinned_path.exists() else None
+
+    result = build_recipes(pdfs, input_dir / 'images', input_dir / 'mix_panels', _find_template(input_dir, template),
+                           out_dir, pinned=pinned, mode=mode, **options)
+
+    built = set(result['built'])
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'shard': index,
+        'shard_count': count,
+        'slugs': {slug: stem for slug, stem in slugs.items() if stem in built},
+        'files': {p.relative_to(out_dir).as_posix(): _sha256(p)
+                  for p in sorted((out_dir / 'recipes').rglob('*')) if p.is_file()},
+        'problems': result['problems'],
+    }
+    (out_dir / SHARD_MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+    return manifest
+
+
+def merge_shards(shard_dirs: List[pathlib.Path], dest_dir: pathlib.Path) -> pathlib.Path:
+    """Check and combine shard outputs into dest_dir/out, and write dest_dir/dist.zip."""
+    manifests = []
+    for d in map(pathlib.Path, shard_dirs):
+        m = json.loads((d / SHARD_MANIFEST).read_text(encoding='utf-8'))
+        if m.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"{d}: unsupported shard manifest version {m.get('version')!r}")
+        manifests.append((d, m))
+    if not manifests:
+        raise ValueError("No shards to merge.")
+
+    counts = {m['shard_count'] for _, m in manifests}
+    if len(counts) != 1:
+        raise ValueError(f"Shards disagree on shard count: {sorted(counts)}")
+    count = counts.pop()
+    seen = sorted(m['shard'] for _, m in manifests)
+    if seen != list(range(count)):
+        raise ValueError(f"Expected shards 0..{count - 1} exactly once, got {seen}")
+
+    owner: Dict[str, str] = {}
+    for d, m in manifests:
+        for slug in m['slugs']:
+            if slug in owner:
+                raise ValueError(f"Duplicate recipe slug {slug!r} in {owner[slug]} and {d}")
+            owner[slug] = str(d)
+
+    resolution: Dict[str, Any] = {}
+    conflicts: List[str] = []
+    for d, _ in manifests:
+        if (d / 'resolution.json').exists():
+            for name, rec in load_manifest(d / 'resolution.json').items():
+                conflict = _merge_resolution(resolution, name, rec)
+                if conflict:
+                    conflicts.append(f"{conflict} (in {d})")
+    if conflicts:
+        raise ValueError("Shards disagree on ingredient resolution (pin a resolution.json to fix): " + "; ".join(conflicts))
+
+    out = pathlib.Path(dest_dir) / 'out'
+    if out.exists():
+        shutil.rmtree(out)
+    out.mkdir(parents=True)
+    problems: List[Dict[str, Any]] = []
+    for d, m in manifests:
+        for rel, digest in m['files'].items():
+            src = d / rel
+            if _sha256(src) != digest:
+                raise ValueError(f"{src} does not match its shard manifest")
+            dst = out / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src, dst)
+        problems.extend(m['problems'])
+
+    write_manifest(out / 'resolution.json', resolution)
+    if problems:
+        (out / 'problems.json').write_text(json.dumps(problems, indent=2), encoding='utf-8')
+    archive = pathlib.Path(dest_dir) / 'dist.zip'
+    archive.write_bytes(write_archive(out).getvalue())
+    return archive
+
+
+# Fields a shard only records for the conversions it ran, so shards that saw
+# different units of one ingredient legitimately differ in them.
+CONVERSION_FIELDS = ('grams_per_unit', 'density')
+
+
+def _without_conversions(rec: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in rec.items() if k not in CONVERSION_FIELDS}
+
+
+def _merge_resolution(resolution: Dict[str, Any], name: str, rec: Dict[str, Any]) -> Optional[str]:
+    """Fold one shard's record into resolution; returns a description of any conflict."""
+    have = resolution.get(name)
+    if have is None:
+        resolution[name] = rec
+        return None
+    if _without_conversions(have) != _without_conversions(rec):
+        return f"{name!r} resolved differently"
+    if have.get('density') and rec.get('density') and have['density'] != rec['density']:
+        return f"{name!r} has different density records"
+    factors = dict(have.get('grams_per_unit') or {})
+    for unit, f in (rec.get('grams_per_unit') or {}).items():
+        if factors.setdefault(unit, f) != f:
+            return f"{name!r} has {factors[unit]} g and {f} g per {unit}"
+    if factors:
+        have['grams_per_unit'] = factors
+    if rec.get('density'):
+        have['density'] = rec['density']
+    return None
+
+
+def _build_shard_job(args):
+    input_dir, out_dir, index, count, kwargs = args
+    return build_shard(input_dir, out_dir, index, count, **kwargs)
+
+
+def run_local(input_dir: pathlib.Path, dest_dir: pathlib.Path, count: int, workers: Optional[int] = None,
+              **kwargs) -> pathlib.Path:
+    """Build every shard in a local process pool, then merge."""
+    shards_root = pathlib.Path(dest_dir) / 'shards'
+    jobs = [(input_dir, shards_root / str(i), i, count, kwargs) for i in range(count)]
+    with ProcessPoolExecutor(max_workers=workers or min(count, os.cpu_count() or 1)) as pool:
+        list(pool.map(_build_shard_job, jobs))
+    return merge_shards([j[1] for j in jobs], dest_dir)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m recipegen.shard', description='Sharded recipe builds.')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+
+    def add_build_options(p):
+        p.add_argument('input', type=pathlib.Path)
+        p.add_argument('--out', type=pathlib.Path, required=True)
+        p.add_argument('--template', type=pathlib.Path)
+        p.add_argument('--units', choices=('us', 'metric'), default='us')
+        p.add_argument('--site-base-url')
+        p.add_argument('--no-jsonld', action='store_true')
+        p.add_argument('--mode', choices=('stop', 'continue', 'validate'), default='continue')
+
+    b = sub.add_parser('build', help='build one shard')
+    add_build_options(b)
+    b.add_argument('--shard', required=True, help='INDEX/COUNT, e.g. 0/4')
+
+    r = sub.add_parser('run', help='build all shards with local processes, then merge')
+    add_build_options(r)
+    r.add_argument('--shards', type=int, required=True)
+    r.add_argument('--workers', type=int)
+
+    m = sub.add_parser('merge', help='merge shard outputs into the final site and dist.zip')
+    m.add_argument('shards', nargs='+', type=pathlib.Path)
+    m.add_argument('--out', type=pathlib.Path, required=True)
+
+    args = ap.parse_args(argv)
+    try:
+        if args.cmd == 'merge':
+            print(merge_shards(args.shards, args.out))
+            return 0
+        options = dict(template=args.template, mode=args.mode, units=args.units,
+                       site_base_url=args.site_base_url, emit_jsonld=not args.no_jsonld)
+        if args.cmd == 'build':
+            index, count = parse_shard_spec(args.shard)
+            manifest = build_shard(args.input, args.out, index, count, **options)
+            print(f"shard {index}/{count}: {len(manifest['slugs'])} built, {len(manifest['problems'])} problem(s)")
+        else:
+            print(run_local(args.input, args.out, args.shards, workers=args.workers, **options))
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 import re
-import yaml
 import pathlib
-from typing import Optional, Dict, Any
+from collections import deque
+from functools import lru_cache
+from typing import Optional, Dict, Any, Iterable, List, Tuple
 
 from .builtins import BUILTIN_DENSITIES, SIZE_WEIGHTS
 
@@ -11,6 +12,7 @@ DATA = pathlib.Path(__file__).resolve().parent.parent / 'data'
 
 
 def load_yaml(p: pathlib.Path) -> Dict[str, Any]:
+    import yaml
     try:
         if p.exists():
             with open(p, 'r', encoding='utf-8') as f:
@@ -31,8 +33,126 @@ def _clean_name(s: str) -> str:
     return re.sub(r'\s+', ' ', s).strip()
 
 
-def _merged_densities() -> Dict[str, Dict[str, float]]:
-    """Merge built-in densities with optional YAML files."""
+# --- Unit aliases -------------------------------------------------------------
+
+# Every accepted spelling => canonical unit. Canonical names are what the
+# pint registry understands (mass/volume) or the SIZE_WEIGHTS size keys.
+UNIT_ALIASES: Dict[str, str] = {}
+for _canon, _spellings in {
+    'gram':        ('g', 'gr', 'gram', 'grams', 'gramme', 'grammes'),
+    'kilogram':    ('kg', 'kgs', 'kilo', 'kilos', 'kilogram', 'kilograms'),
+    'ounce':       ('oz', 'ozs', 'ounce', 'ounces'),
+    'pound':       ('lb', 'lbs', 'pound', 'pounds'),
+    'teaspoon':    ('tsp', 'tsps', 'teaspoon', 'teaspoons'),
+    'tablespoon':  ('tbsp', 'tbsps', 'tbs', 'tbl', 'tablespoon', 'tablespoons'),
+    'cup':         ('c', 'cup', 'cups'),
+    'fluid_ounce': ('fl oz', 'floz', 'fl ounce', 'fl ounces', 'fluid ounce', 'fluid ounces'),
+    'milliliter':  ('ml', 'mls', 'milliliter', 'milliliters', 'millilitre', 'millilitres'),
+    'liter':       ('l', 'liter', 'liters', 'litre', 'litres'),
+    'small':       ('small', 'sm'),
+    'medium':      ('medium', 'med'),
+    'large':       ('large', 'lg'),
+    'clove':       ('clove', 'cloves'),
+    'each':        ('each', 'ea'),
+    'whole':       ('whole',),
+}.items():
+    for _s in _spellings + (_canon,):
+        UNIT_ALIASES[_s] = _canon
+
+MASS_UNITS = ('gram', 'kilogram', 'ounce', 'pound')
+VOLUME_UNITS = ('teaspoon', 'tablespoon', 'cup', 'fluid_ounce', 'milliliter', 'liter')
+SIZE_UNITS = ('small', 'medium', 'large', 'clove', 'each', 'whole')
+
+# Density table keys that give grams for one canonical volume unit.
+DENSITY_KEYS = {'teaspoon': 'tsp_g', 'tablespoon': 'tbsp_g', 'cup': 'cup_g'}
+
+
+def canonical_unit(unit: Optional[str]) -> Optional[str]:
+    """Map any accepted spelling ('Tbsp', 'fl. oz', 'Litres') to its canonical unit."""
+    if unit is None:
+        return None
+    u = re.sub(r'[.\s]+', ' ', unit.lower()).strip()
+    return UNIT_ALIASES.get(u)
+
+
+@lru_cache(maxsize=1)
+def _unit_factors() -> Dict[str, float]:
+    """Grams per mass unit and millilitres per volume unit, taken from pint once."""
+    import pint
+    ureg = pint.UnitRegistry()
+    out: Dict[str, float] = {}
+    for u in MASS_UNITS:
+        out[u] = float(ureg.Quantity(1, u).to('gram').magnitude)
+    for u in VOLUME_UNITS:
+        out[u] = float(ureg.Quantity(1, u).to('milliliter').magnitude)
+    return out
+
+
+# --- Size-weight keyword matching ---------------------------------------------
+
+class _KeywordAutomaton:
+    """Aho-Corasick matcher: finds every keyword occurring in a text in one pass."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[int]] = [[]]
+        self.keywords = list(keywords)
+        for idx, kw in enumerate(self.keywords):
+            node = 0
+            for ch in kw:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(idx)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                if node:
+                    f = self.fail[node]
+                    while f and ch not in self.goto[f]:
+                        f = self.fail[f]
+                    self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def first_match(self, text: str) -> Optional[str]:
+        """Return the earliest-declared keyword contained in text (same pick as a linear `in` scan)."""
+        best = None
+        node = 0
+        for ch in text:
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for idx in self.out[node]:
+                if best is None or idx < best:
+                    best = idx
+        return None if best is None else self.keywords[best]
+
+
+_SIZE_MATCHER = _KeywordAutomaton(SIZE_WEIGHTS.keys())
+
+
+# --- Density tables -----------------------------------------------------------
+
+def _density_signature() -> Tuple[int, int]:
+    """Modification stamps of the YAML density files; changes invalidate caches."""
+    def stamp(p: pathlib.Path) -> int:
+        try:
+            return p.stat().st_mtime_ns
+        except OSError:
+            return 0
+    return (stamp(DATA / 'density_overrides.yml'), stamp(DATA / 'common_densities.yml'))
+
+
+@lru_cache(maxsize=4)
+def _merged_densities_for(signature: Tuple[int, int]) -> Dict[str, Dict[str, float]]:
     dens_over = load_yaml(DATA / 'density_overrides.yml')
     commons = load_yaml(DATA / 'common_densities.yml')
     merged: Dict[str, Dict[str, float]] = {}
@@ -42,68 +162,181 @@ def _merged_densities() -> Dict[str, Dict[str, float]]:
     return merged
 
 
-def normalize_volume_to_grams(name: str, amount: float, unit: Optional[str]) -> Optional[float]:
-    """
-    Convert (amount, unit, ingredient-name) => grams.
+def _merged_densities() -> Dict[str, Dict[str, float]]:
+    """Merge built-in densities with optional YAML files."""
+    return _merged_densities_for(_density_signature())
 
-    Supports:
-      - g/gram direct inputs
-      - tsp/tbsp/cup using density tables (merged from built-ins + YAML)
-      - size/count units: small/medium/large/clove/each/whole via SIZE_WEIGHTS
-    Returns None if unknown.
-    """
-    if amount is None or unit is None:
-        return None
 
-    unit = unit.lower().strip()
-    base = _clean_name(name)
+def _grams_per_ml(dens: Dict[str, Any], factors: Dict[str, float]) -> Optional[float]:
+    v = dens.get('ml_g') or dens.get('g_per_ml')
+    if isinstance(v, (int, float)):
+        return float(v)
+    for canon in ('cup', 'tablespoon', 'teaspoon'):
+        v = dens.get(DENSITY_KEYS[canon])
+        if isinstance(v, (int, float)):
+            return float(v) / factors[canon]
+    return None
 
-    # --- direct gram inputs ---------------------------------------------------
-    if unit in ('g', 'gram', 'grams'):
-        try:
-            return float(amount)
-        except Exception:
-            return None
 
-    # --- size/count units: '1/2 medium onion', '2 large eggs', '1 clove garlic'
-    if unit in ('small', 'medium', 'large', 'clove', 'each', 'whole'):
-        weights = None
-        for key, table in SIZE_WEIGHTS.items():
-            if key in base:
-                weights = table
-                break
-        if weights:
-            if unit in weights:
-                return float(amount) * float(weights[unit])
-            if unit in ('each', 'whole') and 'medium' in weights:
-                return float(amount) * float(weights['medium'])
+# --- Conversion ---------------------------------------------------------------
 
-    # --- volume units with densities -----------------------------------------
+def density_for(name: str) -> Optional[Dict[str, float]]:
+    """Density record the converter would use for this ingredient, if any."""
+    base = _clean_name(name)
     merged = _merged_densities()
     dens = merged.get(base)
     if not dens and base.endswith('s'):
         dens = merged.get(base[:-1])  # singular fallback
+    return dens or None
+
+
+def density_used(name: str, unit: Optional[str]) -> Optional[Dict[str, float]]:
+    """The table density record a conversion of `name` in `unit` relies on, or None (mass, size, water fallback)."""
+    canon = canonical_unit(unit)
+    dens = density_for(name) if canon in VOLUME_UNITS else None
+    if not dens:
+        return None
+    if isinstance(dens.get(DENSITY_KEYS.get(canon, '')), (int, float)) or _grams_per_ml(dens, _unit_factors()) is not None:
+        return dens
+    return None
+
+
+def _grams_per_unit(base: str, canon: str, dens: Optional[Dict[str, float]] = None) -> Optional[float]:
+    """
+    Grams for one `canon` unit of cleaned ingredient `base`, or None if unknown.
+    `dens` replaces the density-table lookup (e.g. a density pinned in a manifest).
+    """
+    factors = _unit_factors()
+
+    # --- mass units -----------------------------------------------------------
+    if canon in MASS_UNITS:
+        return factors[canon]
+
+    # --- size/count units: '1/2 medium onion', '2 large eggs', '1 clove garlic'
+    if canon in SIZE_UNITS:
+        key = _SIZE_MATCHER.first_match(base)
+        weights = SIZE_WEIGHTS.get(key) if key else None
+        if weights:
+            if canon in weights:
+                return float(weights[canon])
+            if canon in ('each', 'whole') and 'medium' in weights:
+                return float(weights['medium'])
+        return None
+
+    # --- volume units with densities -----------------------------------------
+    if dens is None:
+        dens = density_for(base)
 
     if dens:
-        if unit in ('tsp', 'teaspoon', 'teaspoons'):
-            v = dens.get('tsp_g')
-            if isinstance(v, (int, float)):
-                return float(amount) * float(v)
-        if unit in ('tbsp', 'tablespoon', 'tablespoons'):
-            v = dens.get('tbsp_g')
-            if isinstance(v, (int, float)):
-                return float(amount) * float(v)
-        if unit in ('cup', 'cups', 'c'):
-            v = dens.get('cup_g')
-            if isinstance(v, (int, float)):
-                return float(amount) * float(v)
-        if unit in ('ml', 'milliliter', 'milliliters'):
-            v = dens.get('ml_g') or dens.get('g_per_ml')
-            if isinstance(v, (int, float)):
-                return float(amount) * float(v)
+        v = dens.get(DENSITY_KEYS.get(canon, ''))
+        if isinstance(v, (int, float)):
+            return float(v)
+        g_ml = _grams_per_ml(dens, factors)
+        if g_ml is not None:
+            return g_ml * factors[canon]
 
     # Conservative fallback: treat 1 ml == 1 g for water-like liquids only
-    if unit in ('ml', 'milliliter', 'milliliters') and any(k in base for k in ('water', 'vinegar', 'juice')):
-        return float(amount)
+    if any(k in base for k in ('water', 'vinegar', 'juice')):
+        return factors[canon]
 
     return None
+
+
+def grams_per_unit(name: str, unit: Optional[str]) -> Optional[float]:
+    """Cached grams-per-unit lookup keyed by (cleaned ingredient, canonical unit)."""
+    canon = canonical_unit(unit)
+    if canon is None:
+        return None
+    return _cached_grams_per_unit(_clean_name(name), canon)
+
+
+# Names come from uploads, so the cache is bounded; the density signature in
+# the key retires entries computed from older YAML tables.
+FACTOR_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=FACTOR_CACHE_SIZE)
+def _grams_per_unit_for(base: str, canon: str, signature: Tuple[int, int]) -> Optional[float]:
+    return _grams_per_unit(base, canon)
+
+
+def _cached_grams_per_unit(base: str, canon: str) -> Optional[float]:
+    return _grams_per_unit_for(base, canon, _density_signature())
+
+
+def normalize_volume_to_grams(name: str, amount: float, unit: Optional[str],
+                              density: Optional[Dict[str, float]] = None) -> Optional[float]:
+    """
+    Convert (amount, unit, ingredient-name) => grams.
+
+    Supports:
+      - mass units: g/kg/oz/lb (factors from pint)
+      - volume units: tsp/tbsp/cup/fl oz/ml/l using density tables
+        (merged from built-ins + YAML); any one density key is enough
+      - size/count units: small/medium/large/clove/each/whole via SIZE_WEIGHTS
+    A `density` record, when given, is used instead of the density tables.
+    Returns None if unknown.
+    """
+    if amount is None or unit is None:
+        return None
+    try:
+        amount = float(amount)
+    except Exception:
+        return None
+    if density is not None:
+        canon = canonical_unit(unit)
+        f = _grams_per_unit(_clean_name(name), canon, density) if canon else None
+    else:
+        f = grams_per_unit(name, unit)
+    return amount * f if f is not None else None
+
+
+def unit_factors(pairs: Iterable[Tuple[str, Optional[str]]],
+                 densities: Optional[Dict[str, Dict[str, float]]] = None,
+                 factors: Optional[Dict[str, Dict[str, float]]] = None) -> Dict[Tuple[str, str], Optional[float]]:
+    """
+    Grams per unit for each distinct (name, unit) pair, keyed by (name, canonical unit).
+
+    Unpinned names share one lookup per (cleaned name, canonical unit).
+    `densities` maps a name to a density record that replaces the tables for
+    that name, and `factors` maps a name to fixed grams per canonical unit;
+    both come from a pinned manifest, and a fixed factor wins.
+    """
+    out: Dict[Tuple[str, str], Optional[float]] = {}
+    for name, unit in pairs:
+        canon = canonical_unit(unit)
+        if canon is None or (name, canon) in out:
+            continue
+        fixed = (factors.get(name) or {}).get(canon) if factors else None
+        dens = densities.get(name) if densities else None
+        if fixed is not None:
+            out[name, canon] = float(fixed)
+        elif dens is not None:
+            out[name, canon] = _grams_per_unit(_clean_name(name), canon, dens)
+        else:
+            out[name, canon] = _cached_grams_per_unit(_clean_name(name), canon)
+    return out
+
+
+def to_grams(batch: Iterable[Tuple[str, float, Optional[str]]],
+             densities: Optional[Dict[str, Dict[str, float]]] = None,
+             factors: Optional[Dict[str, Dict[str, float]]] = None) -> List[Optional[float]]:
+    """
+    Convert many (name, amount, unit) lines at once; order is preserved.
+
+    Each distinct (name, unit) factor is looked up once by unit_factors() (see
+    there for `densities` and `factors`) and multiplied into every amount
+    that shares it.
+    """
+    rows = []
+    for name, amount, unit in batch:
+        try:
+            rows.append((name, float(amount), unit))
+        except (TypeError, ValueError):
+            rows.append((name, None, unit))
+    per_unit = unit_factors(((name, unit) for name, amount, unit in rows if amount is not None), densities, factors)
+    out: List[Optional[float]] = []
+    for name, amount, unit in rows:
+        f = per_unit.get((name, canonical_unit(unit)))
+        out.append(amount * f if f is not None and amount is not None else None)
+    return out
@@ -1,5 +1,5 @@
 from __future__ import annotations
-import os, requests
+import os
 from typing import Optional, Dict, Any, List
 
 NID_ENERGY_KCAL = 1008
@@ -8,7 +8,7 @@ NID_PROTEIN = 1003
 NID_FAT = 1004
 NID_FIBER = 1079
 
-API_BASE = "https://api.nal.usda.gov/fdc"
+API_BASE = os.getenv("USDA_API_BASE", "https://api.nal.usda.gov/fdc")
 
 def _get_api_key(explicit: Optional[str]) -> Optional[str]:
     return explicit or os.getenv("USDA_API_KEY") or None
@@ -83,9 +83,15 @@ def _extract_from_labelNutrients(food: dict) -> Optional[Dict[str, float]]:
     return None
 
 def search_per100g(query: str, api_key: Optional[str] = None, timeout: int = 10) -> Optional[Dict[str, float]]:
+    food = search_food(query, api_key=api_key, timeout=timeout)
+    return food['per_100g'] if food else None
+
+def search_food(query: str, api_key: Optional[str] = None, timeout: int = 10) -> Optional[Dict[str, Any]]:
+    """Like search_per100g, but also reports which FDC food the values came from."""
     key = _get_api_key(api_key)
     if not key:
         return None
+    import requests
     try:
         resp = requests.get(f"{API_BASE}/v1/foods/search", params={"api_key": key, "query": query, "pageSize": 5}, timeout=timeout)
         if resp.status_code != 200:
@@ -95,20 +101,19 @@ def search_per100g(query: str, api_key: Optional[str] = None, timeout: int = 10)
         best = _best_result(results)
         if not best:
             return None
+        fdc_id = best.get("fdcId")
+        def found(per100):
+            return {"fdc_id": fdc_id, "description": best.get("description"), "per_100g": per100}
         per100 = _extract_per100_from_foodNutrients(best)
         if per100:
-            return per100
-        fdc_id = best.get("fdcId")
+            return found(per100)
         if not fdc_id:
             return None
         detail = requests.get(f"{API_BASE}/v1/foods/{fdc_id}", params={"api_key": key}, timeout=timeout)
         if detail.status_code != 200:
             return None
         food = detail.json()
-        per100 = _extract_per100_from_foodNutrients(food)
-        if per100:
-            return per100
-        per100 = _extract_from_labelNutrients(food)
-        return per100
+        per100 = _extract_per100_from_foodNutrients(food) or _extract_from_labelNutrients(food)
+        return found(per100) if per100 else None
     except Exception:
         return None
@@ -0,0 +1,46 @@
+import json
+
+from recipegen import build
+from recipegen.units import _unit_factors, density_for
+
+
+def _fake_pipeline(monkeypatch, ingredients, pinned_records=None):
+    monkeypatch.setattr(build, 'parse_recipe_pdf', lambda pdf, source=None: {
+        'servings': 2, 'ingredients': [dict(zip(('name', 'amount', 'unit'), ing)) for ing in ingredients[pdf.stem]],
+        'instructions': []})
+    per100 = {'calories': 0.0, 'fat_g': 0.0, 'carbs_g': 0.0, 'fiber_g': 0.0, 'protein_g': 0.0}
+
+    def resolve(names, panels_dir, **kwargs):
+        pinned = kwargs.get('pinned') or {}
+        return {n: ({**pinned[n], 'pinned': True} if n in pinned else {'source': 'builtin', 'per_100g': per100})
+                for n in names}
+    monkeypatch.setattr(build, 'resolve_ingredients', resolve)
+
+
+def _build(tmp_path, stems, pinned=None):
+    (tmp_path / 'images').mkdir(exist_ok=True)
+    out = tmp_path / 'out'
+    result = build.build_recipes([tmp_path / f'{s}.pdf' for s in stems], tmp_path / 'images', tmp_path / 'panels',
+                                 tmp_path / 'tpl.html', out, mode='validate', pinned=pinned)
+    return result, json.loads((out / 'resolution.json').read_text())['ingredients']
+
+
+def test_manifest_records_applied_factor_and_density(tmp_path, monkeypatch):
+    _fake_pipeline(monkeypatch, {'a': [('water', 1.0, 'cup'), ('olive oil', 2.0, 'tbsp')],
+                                 'b': [('water', 1.5, 'cups'), ('eggs', 2.0, 'large')]})
+    _, manifest = _build(tmp_path, ['a', 'b'])
+    assert manifest['water']['grams_per_unit'] == {'cup': _unit_factors()['cup']}
+    assert 'density' not in manifest['water']                     # 1 g/ml fallback, no table entry
+    assert manifest['olive oil']['grams_per_unit'] == {'tablespoon': 13.5}
+    assert manifest['olive oil']['density'] == density_for('olive oil')
+    assert manifest['eggs'] == {'source': 'builtin', 'per_100g': manifest['eggs']['per_100g'],
+                                'grams_per_unit': {'large': 50.0}}
+
+
+def test_pinned_manifest_converts_new_units_with_its_density(tmp_path, monkeypatch):
+    _fake_pipeline(monkeypatch, {'a': [('olive oil', 2.0, 'tbsp')]})
+    _, manifest = _build(tmp_path, ['a'])
+    _fake_pipeline(monkeypatch, {'a': [('olive oil', 1.0, 'tsp')]})
+    result, repinned = _build(tmp_path, ['a'], pinned=manifest)
+    assert [p['kind'] for p in result['problems']] == ['missing_image']
+    assert repinned['olive oil']['grams_per_unit'] == {'tablespoon': 13.5, 'teaspoon': 4.5}
@@ -0,0 +1,78 @@
+import mmap
+from types import SimpleNamespace
+
+import pytest
+
+from recipegen import ingest
+from recipegen.ingest import IngestStream, UploadBudget, UploadTooLarge, open_buffer, save_upload, sniff_kind
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 8
+
+
+@pytest.mark.parametrize('head, kind', [
+    (b'%PDF-1.7\n', 'pdf'),
+    (PNG, 'png'),
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF', 'jpeg'),
+    (b'RIFF\x10\x00\x00\x00WEBPVP8 ', 'webp'),
+    (b'<html><body>{{ title }}', 'text'),
+    ('café brûlée'.encode('utf-8')[:12], 'text'),   # cut inside a multi-byte character
+    (b'\x00\x01\x02binary', None),
+    (b'', None),
+])
+def test_sniff_kind(head, kind):
+    assert sniff_kind(head) == kind
+
+
+def _feed(stream, data, chunk=64 * 1024):
+    for i in range(0, len(data), chunk):
+        stream.write(data[i:i + chunk])
+
+
+def test_file_limit():
+    stream = IngestStream(UploadBudget(max_bytes=10_000), filename='big.pdf', max_bytes=100)
+    stream.write(b'%PDF-' + b'x' * 95)
+    with pytest.raises(UploadTooLarge, match='big.pdf'):
+        stream.write(b'x')
+
+
+def test_request_budget_is_shared_between_parts():
+    budget = UploadBudget(max_bytes=150)
+    IngestStream(budget, max_bytes=100).write(b'a' * 100)
+    with pytest.raises(UploadTooLarge, match='request limit'):
+        IngestStream(budget, max_bytes=100).write(b'b' * 51)
+
+
+def test_small_part_stays_in_memory(tmp_path):
+    stream = IngestStream(UploadBudget(), filename='r.pdf', spool_dir=tmp_path)
+    stream.write(b'%PDF-small')
+    assert stream.in_memory and stream.kind == 'pdf'
+    entry = save_upload(SimpleNamespace(stream=stream, filename='r.pdf'), tmp_path, ('pdf',))
+    assert entry['data'] == b'%PDF-small' and entry['path'].read_bytes() == b'%PDF-small'
+    with open_buffer(entry) as buf:
+        assert buf.read() == b'%PDF-small'
+
+
+def test_large_part_is_moved_not_copied(tmp_path):
+    spool, dest = tmp_path / 'spool', tmp_path / 'work'
+    spool.mkdir(), dest.mkdir()
+    data = PNG + b'\x01' * (ingest.SPOOL_BYTES + 1)
+    stream = IngestStream(UploadBudget(), filename='Photo.PNG', spool_dir=spool)
+    _feed(stream, data)
+    assert not stream.in_memory and len(list(spool.iterdir())) == 1
+
+    entry = save_upload(SimpleNamespace(stream=stream, filename='Photo.PNG'), dest, ('png',))
+    assert entry['path'] == dest / 'Photo.png' and entry['data'] is None
+    assert entry['path'].read_bytes() == data and entry['size'] == len(data)
+    assert list(spool.iterdir()) == []
+    with open_buffer(entry) as buf:
+        assert isinstance(buf, mmap.mmap) and buf[:8] == PNG[:8]
+    assert buf.closed
+    stream.close()
+
+
+def test_unaccepted_part_is_rejected_and_spool_removed(tmp_path):
+    stream = IngestStream(UploadBudget(), filename='fake.pdf', spool_dir=tmp_path)
+    _feed(stream, PNG + b'\x01' * (ingest.SPOOL_BYTES + 1))
+    assert save_upload(SimpleNamespace(stream=stream, filename='fake.pdf'), tmp_path, ('pdf',)) is None
+    stream.close()
+    assert list(tmp_path.iterdir()) == []
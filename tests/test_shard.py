@@ -0,0 +1,63 @@
+import json
+import pickle
+
+import pytest
+
+from recipegen import shard
+from recipegen.build import BuildStopped, problem
+from recipegen.resolve import write_manifest
+
+PER100 = {'calories': 0.0, 'fat_g': 0.0, 'carbs_g': 0.0, 'fiber_g': 0.0, 'protein_g': 0.0}
+
+
+def test_build_stopped_survives_pickling():
+    e = BuildStopped([problem('a', 'missing_image', 'No image found for a.')])
+    back = pickle.loads(pickle.dumps(e))
+    assert str(back) == 'No image found for a.' and back.problems == e.problems
+
+
+def test_run_local_stop_mode_reports_the_problem(tmp_path, capsys):
+    src = tmp_path / 'in'
+    (src / 'pdfs').mkdir(parents=True)
+    (src / 'images').mkdir()
+    (src / 'pdfs' / 'pancakes.pdf').write_bytes(b'%PDF-1.4\n')
+    (src / 'template.html').write_text('{{ title }}')
+    with pytest.raises(BuildStopped) as info:
+        shard.run_local(src, tmp_path / 'dist', 2, workers=2, mode='stop')
+    assert info.value.problems[0]['kind'] == 'missing_image'
+
+    assert shard.main(['run', str(src), '--shards', '2', '--mode', 'stop', '--out', str(tmp_path / 'dist2')]) == 1
+    assert 'error: No image found for pancakes.' in capsys.readouterr().err
+    assert not (src / 'mix_panels').exists()
+
+
+def _fake_shard(root, index, count, resolution):
+    d = root / f's{index}'
+    (d / 'recipes').mkdir(parents=True)
+    write_manifest(d / 'resolution.json', resolution)
+    manifest = {'version': shard.MANIFEST_VERSION, 'shard': index, 'shard_count': count,
+                'slugs': {}, 'files': {}, 'problems': []}
+    (d / shard.SHARD_MANIFEST).write_text(json.dumps(manifest))
+    return d
+
+
+def test_merge_combines_conversions_of_the_same_ingredient(tmp_path):
+    oil = {'source': 'builtin', 'per_100g': PER100}
+    dens = {'tbsp_g': 13.5, 'tsp_g': 4.5}
+    dirs = [_fake_shard(tmp_path, 0, 2, {'olive oil': {**oil, 'grams_per_unit': {'tablespoon': 13.5}, 'density': dens}}),
+            _fake_shard(tmp_path, 1, 2, {'olive oil': {**oil, 'grams_per_unit': {'gram': 1.0}}})]
+    shard.merge_shards(dirs, tmp_path / 'dist')
+    merged = json.loads((tmp_path / 'dist' / 'out' / 'resolution.json').read_text())['ingredients']
+    assert merged['olive oil'] == {**oil, 'grams_per_unit': {'tablespoon': 13.5, 'gram': 1.0}, 'density': dens}
+
+
+@pytest.mark.parametrize('other, message', [
+    ({'source': 'usda', 'per_100g': PER100}, 'resolved differently'),
+    ({'source': 'builtin', 'per_100g': PER100, 'grams_per_unit': {'cup': 240.0}}, 'per cup'),
+])
+def test_merge_rejects_conflicting_records(tmp_path, other, message):
+    water = {'source': 'builtin', 'per_100g': PER100, 'grams_per_unit': {'cup': 236.5882365}}
+    dirs = [_fake_shard(tmp_path, 0, 2, {'water': water}), _fake_shard(tmp_path, 1, 2, {'water': other})]
+    with pytest.raises(ValueError, match=message):
+        shard.merge_shards(dirs, tmp_path / 'dist')
+    assert not (tmp_path / 'dist' / 'dist.zip').exists()
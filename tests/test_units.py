@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from recipegen import units
+from recipegen.builtins import SIZE_WEIGHTS
+from recipegen.parsers import parse_ingredient_line
+from recipegen.units import _KeywordAutomaton, to_grams
+
+
+def _linear_first(keywords, text):
+    return next((k for k in keywords if k in text), None)
+
+
+def test_automaton_matches_linear_scan_on_size_keys():
+    matcher = _KeywordAutomaton(SIZE_WEIGHTS.keys())
+    for text in ('medium onion', 'eggs', 'garlic cloves', 'lime zest', 'red onion and garlic', 'flour', ''):
+        assert matcher.first_match(text) == _linear_first(list(SIZE_WEIGHTS), text)
+
+
+def test_automaton_matches_linear_scan_on_overlapping_keywords():
+    keywords = ['he', 'she', 'his', 'hers', 'e', 'rs', 'ashe']
+    matcher = _KeywordAutomaton(keywords)
+    rnd = random.Random(0)
+    for _ in range(500):
+        text = ''.join(rnd.choice('ahers') for _ in range(rnd.randrange(12)))
+        assert matcher.first_match(text) == _linear_first(keywords, text)
+
+
+@pytest.fixture
+def counted_factors(monkeypatch):
+    calls = []
+    real = units._grams_per_unit
+
+    def counting(base, canon, dens=None):
+        calls.append((base, canon))
+        return real(base, canon, dens)
+
+    units._grams_per_unit_for.cache_clear()
+    monkeypatch.setattr(units, '_grams_per_unit', counting)
+    yield calls
+    units._grams_per_unit_for.cache_clear()
+
+
+def test_to_grams_looks_up_each_group_once(counted_factors):
+    batch = [('olive oil', 2, 'tbsp'), ('Olive Oil', 1, 'Tablespoons'), ('olive oil', 1, 'tsp'),
+             ('eggs', 2, 'large'), ('eggs', 1, 'lg'), ('almond flour', 1, 'cup'), ('water', None, 'cup')]
+    grams = to_grams(batch)
+    assert grams[:5] == [27.0, 13.5, 4.5, 100.0, 50.0]
+    assert grams[5:] == [None, None]
+    assert sorted(counted_factors) == sorted({('olive oil', 'tablespoon'), ('olive oil', 'teaspoon'),
+                                              ('eggs', 'large'), ('almond flour', 'cup')})
+
+
+def test_to_grams_pinned_factor_and_density_replace_tables():
+    batch = [('olive oil', 2, 'tbsp'), ('olive oil', 1, 'cup'), ('olive oil', 1, 'tsp')]
+    grams = to_grams(batch, densities={'olive oil': {}}, factors={'olive oil': {'tablespoon': 10.0}})
+    assert grams == [20.0, None, None]
+
+
+def test_to_grams_matches_scalar_conversion():
+    batch = [('olive oil', 3, 'tbsp'), ('water', 1.5, 'cups'), ('onion', 0.5, 'medium'), ('butter', 100, 'g')]
+    assert to_grams(batch) == [units.normalize_volume_to_grams(*row) for row in batch]
+
+
+@pytest.mark.parametrize('line, unit', [('2 cloves garlic', 'cloves'), ('1 lg egg', 'lg'),
+                                        ('1/2 med onion, chopped', 'med'), ('3 ea limes', 'ea')])
+def test_size_unit_spellings_parse(line, unit):
+    parsed = parse_ingredient_line(line)
+    assert parsed['unit'] == unit
+    assert units.canonical_unit(unit) in units.SIZE_UNITS
+
+
+def test_unit_factors_are_exact_and_shared_across_amounts():
+    per_unit = units.unit_factors([('water', 'cup'), ('water', 'cups'), ('olive oil', 'tbsp')])
+    assert per_unit == {('water', 'cup'): units._unit_factors()['cup'], ('olive oil', 'tablespoon'): 13.5}
+
+
+def test_pinned_density_covers_units_without_a_pinned_factor():
+    pinned = {'olive oil': units.density_for('olive oil')}
+    grams = to_grams([('olive oil', 1, 'tsp'), ('olive oil', 2, 'tbsp')],
+                     densities=pinned, factors={'olive oil': {'tablespoon': 13.5}})
+    assert grams == [4.5, 27.0]
+
+
+def test_density_used_only_for_table_volume_conversions():
+    assert units.density_used('olive oil', 'tbsp') == units.density_for('olive oil')
+    assert units.density_used('olive oil', 'g') is None
+    assert units.density_used('onion', 'medium') is None
+    assert units.density_used('water', 'cup') is None
@@ -0,0 +1,395 @@
+"""
+End-to-end load test for /generate.
+
+Starts the app under gunicorn (same flags as the Dockerfile by default, and the
+repo's gunicorn.conf.py) against a local stub of the USDA FoodData Central API,
+then fires concurrent multipart requests and reports throughput, latency
+percentiles, error/timeout rates, build problem counts and peak RSS per
+gunicorn process.
+
+    python tools/loadtest.py --requests 200 --concurrency 8
+    python tools/loadtest.py --workers 1,2,4 --threads 1,4 --batch-sizes 1,5,20 \\
+        --mix generate=8,validate=1,index=1 --json results.json
+
+Recipes are synthesized (text PDFs + PNGs) unless --fixtures points at a dir
+with pdfs/, images/ and a template .html. Linux only (RSS is read from /proc).
+"""
+from __future__ import annotations
+import argparse, contextlib, io, itertools, json, math, os, pathlib, random, re, shlex, signal, socket, subprocess, sys, threading, time, zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+REPO = pathlib.Path(__file__).resolve().parent.parent
+
+# Every line converts with the built-in tables (mass units, densities, size
+# weights), so a healthy server builds every synthesized recipe.
+PANTRY = ['2 tbsp olive oil', '1 tsp salt', '1/2 tsp black pepper', '1 tsp garlic powder',
+          '100 g almond flour', '2 large eggs', '50 g shredded mozzarella', '1 tbsp lemon juice',
+          '8 oz cream cheese', '1/2 medium onion, chopped', '2 cloves garlic', '1 tsp chili powder']
+STEPS = ['Preheat the oven to 180C.', 'Mix the dry ingredients.', 'Fold in the wet ingredients.',
+         'Bake for 25 minutes.', 'Cool before serving.']
+
+
+# --- Stub USDA ----------------------------------------------------------------
+
+def _stub_food(query: str) -> Dict[str, Any]:
+    seed = zlib.crc32(query.encode('utf-8'))
+    rnd = random.Random(seed)
+    return {
+        'fdcId': 100000 + seed % 900000,
+        'description': query.upper(),
+        'dataType': 'SR Legacy',
+        'foodNutrients': [
+            {'nutrientId': 1008, 'amount': round(rnd.uniform(20, 600), 1)},
+            {'nutrientId': 1004, 'amount': round(rnd.uniform(0, 50), 1)},
+            {'nutrientId': 1005, 'amount': round(rnd.uniform(0, 30), 1)},
+            {'nutrientId': 1079, 'amount': round(rnd.uniform(0, 10), 1)},
+            {'nutrientId': 1003, 'amount': round(rnd.uniform(0, 25), 1)},
+        ],
+    }
+
+
+def start_stub_usda(latency_ms: float) -> Tuple[ThreadingHTTPServer, str]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            url = urlparse(self.path)
+            if url.path.endswith('/v1/foods/search'):
+                q = parse_qs(url.query).get('query', [''])[0]
+                body = {'foods': [_stub_food(q)]}
+            elif '/v1/foods/' in url.path:
+                body = _stub_food(url.path.rsplit('/', 1)[-1])
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/fdc"
+
+
+# --- Fixtures -----------------------------------------------------------------
+
+def _pdf_escape(s: str) -> str:
+    return s.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_text_pdf(lines: List[str]) -> bytes:
+    """Smallest valid one-page PDF with the given lines of Helvetica text."""
+    text = 'BT /F1 11 Tf 14 TL 50 780 Td ' + ' '.join(f'({_pdf_escape(l)}) Tj T*' for l in lines) + ' ET'
+    objs = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(text), text.encode('latin-1')),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n%s\nendobj\n' % (i, body))
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objs) + 1))
+    for off in offsets:
+        out.write(b'%010d 00000 n \n' % off)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objs) + 1, xref))
+    return out.getvalue()
+
+
+def make_png(width: int, height: int, seed: int) -> bytes:
+    """Photo-sized PNG with smooth random structure, so decode/resize/encode cost is realistic."""
+    from PIL import Image
+    rnd = random.Random(seed)
+    small = (max(1, width // 16), max(1, height // 16))
+    img = Image.frombytes('RGB', small, rnd.randbytes(small[0] * small[1] * 3)).resize((width, height), Image.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format='PNG', compress_level=1)
+    return buf.getvalue()
+
+
+class Corpus:
+    """Recipe fixtures to draw batches from: synthesized, or loaded from --fixtures."""
+
+    def __init__(self, fixtures: Optional[pathlib.Path], size: int, image_px: Tuple[int, int]):
+        self.recipes: List[Tuple[str, bytes, str, bytes]] = []   # (stem, pdf, image name, image)
+        if fixtures:
+            self.template = next(p for p in sorted(fixtures.iterdir()) if p.suffix.lower() in ('.html', '.htm')).read_bytes()
+            images = {p.stem.lower(): p for p in (fixtures / 'images').iterdir()}
+            for pdf in sorted((fixtures / 'pdfs').glob('*.pdf')):
+                img = images.get(pdf.stem.lower())
+                if img:
+                    self.recipes.append((pdf.stem, pdf.read_bytes(), img.name, img.read_bytes()))
+        else:
+            self.template = (REPO / 'templates' / 'master_template.html').read_bytes()
+            for i in range(size):
+                rnd = random.Random(i)
+                lines = ['Servings: %d' % rnd.randint(1, 8), 'Ingredients'] + rnd.sample(PANTRY, rnd.randint(4, 9)) \
+                        + ['Instructions'] + STEPS[:rnd.randint(2, len(STEPS))]
+                stem = f'load-recipe-{i:03d}'
+                self.recipes.append((stem, make_text_pdf(lines), stem + '.png', make_png(*image_px, seed=i)))
+        if not self.recipes:
+            raise SystemExit('No recipes with matching images in the fixtures.')
+
+    def batch(self, n: int, rnd: random.Random):
+        return rnd.sample(self.recipes, min(n, len(self.recipes)))
+
+
+# --- Server under test ----------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(workers: int, threads: int, timeout: int, usda_base: str, extra: List[str]) -> Tuple[subprocess.Popen, str, float]:
+    port = _free_port()
+    env = {**os.environ, 'USDA_API_BASE': usda_base, 'USDA_API_KEY': 'loadtest'}
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+           '--workers', str(workers), '--threads', str(threads), '--timeout', str(timeout),
+           '--log-level', 'warning'] + extra
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=REPO, env=env, start_new_session=True)
+    base = f'http://127.0.0.1:{port}'
+    while time.perf_counter() - t0 < 60:
+        if proc.poll() is not None:
+            raise SystemExit(f'gunicorn exited with {proc.returncode}')
+        try:
+            if requests.get(base + '/', timeout=1).status_code == 200:
+                return proc, base, time.perf_counter() - t0
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    stop_app(proc)
+    raise SystemExit('app did not answer / within 60 s')
+
+
+def stop_app(proc: subprocess.Popen):
+    """Stop the gunicorn process group; safe if it has already exited."""
+    with contextlib.suppress(ProcessLookupError):
+        os.killpg(proc.pid, signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+def _children(pid: int) -> List[int]:
+    out = []
+    for d in pathlib.Path('/proc').iterdir():
+        if d.name.isdigit():
+            try:
+                stat = (d / 'stat').read_text()
+            except OSError:
+                continue
+            if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+                out.append(int(d.name))
+    return out
+
+
+def _rss_kb(pid: int) -> Optional[int]:
+    try:
+        for line in pathlib.Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler(threading.Thread):
+    """Tracks peak RSS of the gunicorn master and each worker."""
+
+    def __init__(self, master: int, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.master, self.interval = master, interval
+        self.peak: Dict[int, int] = {}
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set():
+            for pid in [self.master] + _children(self.master):
+                rss = _rss_kb(pid)
+                if rss is not None and rss > self.peak.get(pid, 0):
+                    self.peak[pid] = rss
+            self.stop.wait(self.interval)
+
+
+# --- Load ---------------------------------------------------------------------
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in ('generate', 'validate', 'index'):
+            raise SystemExit(f'unknown request kind in --mix: {kind!r}')
+        mix.append((kind, float(weight or 1)))
+    return mix
+
+
+# /generate answers 200 with index.html for failures too, so a validate request
+# only counts as ok when the page carries its summary line. Problems that the
+# validation finds are a result, not an error; they are counted separately.
+CHECKED_RX = re.compile(r'Checked (\d+) recipe\(s\): (?:(\d+) problem\(s\) found|no problems found)')
+
+
+def one_request(base: str, kind: str, corpus: Corpus, batch_size: int, timeout: float, rnd: random.Random) -> Dict[str, Any]:
+    rec = {'kind': kind, 'batch': batch_size if kind != 'index' else 0}
+    t0 = time.perf_counter()
+    try:
+        if kind == 'index':
+            r = requests.get(base + '/', timeout=timeout)
+            ok = r.status_code == 200
+        else:
+            files = [('template', ('template.html', corpus.template, 'text/html'))]
+            batch = corpus.batch(batch_size, rnd)
+            for stem, pdf, img_name, img in batch:
+                files.append(('recipes', (stem + '.pdf', pdf, 'application/pdf')))
+                files.append(('images', (img_name, img, 'application/octet-stream')))
+            data = {'units': 'us', 'emit_jsonld': 'on', 'mode': 'continue' if kind == 'generate' else 'validate'}
+            r = requests.post(base + '/generate', files=files, data=data, timeout=timeout)
+            if kind == 'validate':
+                m = CHECKED_RX.search(r.text) if r.status_code == 200 else None
+                ok = bool(m) and int(m.group(1)) == len(batch)
+                if m:
+                    rec['problems'] = int(m.group(2) or 0)
+            else:
+                ok = r.status_code == 200 and r.headers.get('Content-Type', '').startswith('application/zip')
+                if ok:
+                    rec['problems'] = int(r.headers.get('X-Problem-Count', 0))
+        rec.update(status=r.status_code, ok=ok, bytes=len(r.content))
+    except requests.Timeout:
+        rec.update(status=None, ok=False, timeout=True)
+    except requests.RequestException as e:
+        rec.update(status=None, ok=False, error=type(e).__name__)
+    rec['latency'] = time.perf_counter() - t0
+    return rec
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    return s[max(0, math.ceil(p / 100.0 * len(s)) - 1)]  # nearest rank
+
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    def stats(rs):
+        lat = [r['latency'] for r in rs if r['ok']]
+        return {
+            'requests': len(rs),
+            'ok': sum(r['ok'] for r in rs),
+            'error_rate': round(sum(not r['ok'] and not r.get('timeout') for r in rs) / len(rs), 4) if rs else 0.0,
+            'timeout_rate': round(sum(bool(r.get('timeout')) for r in rs) / len(rs), 4) if rs else 0.0,
+            'problems': sum(r.get('problems', 0) for r in rs),
+            **{f'p{p}_s': (round(v, 3) if v is not None else None) for p, v in ((q, percentile(lat, q)) for q in (50, 90, 95, 99))},
+            'max_s': round(max(lat), 3) if lat else None,
+        }
+    out = {'elapsed_s': round(elapsed, 2), 'throughput_rps': round(len(results) / elapsed, 3) if elapsed else None,
+           'all': stats(results)}
+    for kind in sorted({r['kind'] for r in results}):
+        out[kind] = stats([r for r in results if r['kind'] == kind])
+    return out
+
+
+def run_config(args, corpus: Corpus, usda_base: str, workers: int, threads: int) -> Dict[str, Any]:
+    proc, base, boot_s = start_app(workers, threads, args.gunicorn_timeout, usda_base, shlex.split(args.gunicorn_args))
+    sampler = RssSampler(proc.pid)
+    sampler.start()
+    try:
+        mix = parse_mix(args.mix)
+        kinds, weights = zip(*mix)
+        rnd = random.Random(args.seed)
+        plan = [(rnd.choices(kinds, weights)[0], rnd.choice(args.batch_sizes)) for _ in range(args.requests)]
+        for _ in range(args.warmup):
+            one_request(base, 'generate', corpus, 1, args.timeout, random.Random(0))
+
+        results: List[Dict[str, Any]] = []
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(one_request, base, kind, corpus, n, args.timeout, random.Random(args.seed + i))
+                       for i, (kind, n) in enumerate(plan)]
+            for f in futures:
+                results.append(f.result())
+        elapsed = time.perf_counter() - t0
+    finally:
+        sampler.stop.set()
+        sampler.join()
+        stop_app(proc)
+
+    summary = summarize(results, elapsed)
+    summary.update(workers=workers, threads=threads, concurrency=args.concurrency, boot_to_first_200_s=round(boot_s, 2),
+                   peak_rss_mb={('master' if pid == proc.pid else f'worker {pid}'): round(kb / 1024, 1)
+                                for pid, kb in sorted(sampler.peak.items())})
+    return summary
+
+
+def print_summary(s: Dict[str, Any]):
+    print(f"\n== workers={s['workers']} threads={s['threads']} concurrency={s['concurrency']} "
+          f"(boot to first 200: {s['boot_to_first_200_s']} s)")
+    print(f"   {s['all']['requests']} requests in {s['elapsed_s']} s -> {s['throughput_rps']} req/s")
+    print(f"   {'kind':<10}{'n':>6}{'ok':>6}{'err%':>7}{'tmo%':>7}{'prob':>6}{'p50':>8}{'p90':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for kind in ['all'] + [k for k in ('generate', 'validate', 'index') if k in s]:
+        st = s[kind]
+        fmt = lambda v: '-' if v is None else f'{v:.3f}'
+        print(f"   {kind:<10}{st['requests']:>6}{st['ok']:>6}{st['error_rate'] * 100:>6.1f}%{st['timeout_rate'] * 100:>6.1f}%{st['problems']:>6}"
+              f"{fmt(st['p50_s']):>8}{fmt(st['p90_s']):>8}{fmt(st['p95_s']):>8}{fmt(st['p99_s']):>8}{fmt(st['max_s']):>8}")
+    print('   peak RSS: ' + ', '.join(f'{k} {v} MB' for k, v in s['peak_rss_mb'].items()))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ints = lambda s: [int(x) for x in s.split(',')]
+    ap = argparse.ArgumentParser(description='Load-test /generate under gunicorn with a stubbed USDA API.')
+    ap.add_argument('--workers', type=ints, default=[2], help='comma list to sweep (Dockerfile: 2)')
+    ap.add_argument('--threads', type=ints, default=[4], help='comma list to sweep (Dockerfile: 4)')
+    ap.add_argument('--gunicorn-timeout', type=int, default=120)
+    ap.add_argument('--gunicorn-args', default='', help='extra gunicorn arguments')
+    ap.add_argument('--requests', type=int, default=100)
+    ap.add_argument('--concurrency', type=int, default=8)
+    ap.add_argument('--batch-sizes', type=ints, default=[1, 5], help='recipes per request, picked at random')
+    ap.add_argument('--mix', default='generate=1', help='request kinds and weights, e.g. generate=8,validate=1,index=1')
+    ap.add_argument('--timeout', type=float, default=130.0, help='client timeout per request (s)')
+    ap.add_argument('--warmup', type=int, default=2, help='sequential warm-up requests per config (not counted)')
+    ap.add_argument('--fixtures', type=pathlib.Path)
+    ap.add_argument('--corpus-size', type=int, default=40)
+    ap.add_argument('--image-px', type=ints, default=[1600, 1200])
+    ap.add_argument('--usda-latency-ms', type=float, default=50.0)
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--json', type=pathlib.Path, help='write all summaries here')
+    args = ap.parse_args(argv)
+
+    corpus = Corpus(args.fixtures, args.corpus_size, tuple(args.image_px))
+    server, usda_base = start_stub_usda(args.usda_latency_ms)
+    summaries = []
+    try:
+        for workers, threads in itertools.product(args.workers, args.threads):
+            s = run_config(args, corpus, usda_base, workers, threads)
+            print_summary(s)
+            summaries.append(s)
+    finally:
+        server.shutdown()
+    if args.json:
+        args.json.write_text(json.dumps(summaries, indent=2), encoding='utf-8')
+    return 0 if all(s['all']['ok'] == s['all']['requests'] for s in summaries) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())